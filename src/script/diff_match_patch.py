@@ -1,4 +1,4 @@
-#!/usr/bin/python2.4
+#!/usr/bin/python2.7
 
 """Diff Match and Patch
 
@@ -26,12 +26,32 @@ Applies the patch onto another text, allowing for errors.
 
 __author__ = 'fraser@google.com (Neil Fraser)'
 
+import array
+import binascii
+import bisect
 import math
 import time
-import urllib
 import re
 import sys
 
+try:
+  from urllib import quote, unquote
+except ImportError:
+  # Python 3, unquoting to bytes as Python 2 does.
+  from urllib.parse import quote, unquote_to_bytes as unquote
+
+if sys.version_info[0] >= 3:
+  # The Python 2 builtins used below.
+  xrange = range
+  unichr = chr
+  unicode = str
+  basestring = str
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
 class diff_match_patch:
   """Class containing the diff, match and patch methods.
 
@@ -47,6 +67,48 @@ class diff_match_patch:
     self.Diff_Timeout = 1.0
     # Cost of an empty edit operation in terms of edit characters.
     self.Diff_EditCost = 4
+    # Function called as Diff_Trace(event, info) on the phases of diff_main,
+    # info being a dictionary of sizes and timings (None for no tracing).
+    self.Diff_Trace = None
+    # Recursion depth of diff_main, maintained while tracing.
+    self.Diff_TraceDepth = 0
+    # Number of steps d after which diff_bisect carries on with NumPy arrays,
+    # when NumPy is available (0 for never).
+    self.Diff_NumPySteps = 128
+    # Number of steps d after which diff_bisect gives up on the middle snake
+    # and splits at the furthest point reached instead, so that the diff
+    # stays bounded and reproducible (0 for no limit).
+    self.Diff_BisectCost = 0
+    # Algorithm finding the differences left once the texts can't be split:
+    # "myers" (diff_bisect), "onp" (diff_onp), "bitparallel"
+    # (diff_bitParallel) or "auto" for diff_bitParallel within
+    # Diff_BitParallelChars, else diff_onp when the length difference is
+    # larger than the shorter text and Diff_BisectCost doesn't apply.
+    self.Diff_Algorithm = "auto"
+    # Longest text for which "auto" picks diff_bitParallel, whose time and
+    # memory grow with the square of the longer text (0 for never).
+    self.Diff_BitParallelChars = 4096
+    # Shortest common substring around which diff_halfMatch splits texts
+    # that have no half match, found exactly by diff_commonSubstring
+    # (0 for half matches only).
+    self.Diff_HalfMatchChars = 0
+    # Algorithm diffing the lines in diff_lineMode: "myers", "patience" or
+    # "histogram".
+    self.Diff_LineAlgorithm = "myers"
+    # Lines occurring more often are not used to split the histogram diff.
+    self.Diff_HistogramMaxChain = 64
+    # sequence_encoder shared by the calls of diff_lineMode, so that the
+    # lines common to several texts are hashed once (None for a new one per
+    # call).  It keeps every line encoded, so the caller has to start it over.
+    self.Diff_LineEncoder = None
+    # Function called as Diff_Map(function, blocks) instead of map to rediff
+    # the replacement blocks of diff_lineMode, such as the map of a
+    # multiprocessing.Pool to rediff them in parallel (None for map).
+    self.Diff_Map = None
+    # Texts longer than this in total are split at unique common lines into
+    # segments of about this size, diffed through Diff_Map (only when
+    # Diff_Map is set).
+    self.Diff_ParallelChars = 1 << 20
     # At what point is no match declared (0.0 = perfection, 1.0 = very loose).
     self.Match_Threshold = 0.5
     # How far to search for a match (0 = exact location, 1000+ = broad match).
@@ -67,6 +129,20 @@ class diff_match_patch:
     # Multiple short patches (using native ints) are much faster than long ones.
     self.Match_MaxBits = 32
 
+  def __getstate__(self):
+    """Settings sent to other processes along with the blocks of Diff_Map,
+    without the functions of this process, Diff_Map and Diff_Trace, nor the
+    lines of Diff_LineEncoder.
+
+    Returns:
+      Dictionary of the attributes.
+    """
+    state = self.__dict__.copy()
+    state["Diff_Map"] = None
+    state["Diff_Trace"] = None
+    state["Diff_LineEncoder"] = None
+    return state
+
   #  DIFF FUNCTIONS
 
   # The data structure representing a diff is an array of tuples:
@@ -76,6 +152,9 @@ class diff_match_patch:
   DIFF_INSERT = 1
   DIFF_EQUAL = 0
 
+  # Tokens of diff_wordsToChars: words, whitespace and punctuation runs.
+  WORD_TOKEN_REGEX = re.compile(r"\w+|\s+|[^\w\s]+", re.UNICODE)
+
   def diff_main(self, text1, text2, checklines=True, deadline=None):
     """Find the differences between two texts.  Simplifies the problem by
       stripping any common prefix or suffix off the texts before diffing.
@@ -96,7 +175,7 @@ class diff_match_patch:
     if deadline == None:
       # Unlike in most languages, Python counts time in seconds.
       if self.Diff_Timeout <= 0:
-        deadline = sys.maxint
+        deadline = sys.maxsize
       else:
         deadline = time.time() + self.Diff_Timeout
 
@@ -104,29 +183,85 @@ class diff_match_patch:
     if text1 == None or text2 == None:
       raise ValueError("Null inputs. (diff_main)")
 
-    # Check for equality (speedup).
-    if text1 == text2:
-      if text1:
-        return [(self.DIFF_EQUAL, text1)]
-      return []
-
-    # Trim off common prefix (speedup).
-    commonlength = self.diff_commonPrefix(text1, text2)
-    commonprefix = text1[:commonlength]
-    text1 = text1[commonlength:]
-    text2 = text2[commonlength:]
-
-    # Trim off common suffix (speedup).
-    commonlength = self.diff_commonSuffix(text1, text2)
-    if commonlength == 0:
-      commonsuffix = ''
-    else:
-      commonsuffix = text1[-commonlength:]
-      text1 = text1[:-commonlength]
-      text2 = text2[:-commonlength]
+    # Diff with an explicit stack of work instead of recursing: a pair of
+    # texts is either diffed at once, or split by diff_computeStep in two
+    # pairs diffed in turn before their diffs are joined.  The finished diffs
+    # are stacked in the order of the texts.
+    results = []
+    work = [(text1, text2, checklines, self.Diff_TraceDepth + 1)]
+    depth = self.Diff_TraceDepth
+    try:
+      while work:
+        task = work.pop()
+        if task[0] == None:
+          # Both halves of a split are done, join them.
+          (_, middle, commonprefix, commonsuffix, node) = task
+          diffs_b = results.pop()
+          diffs = results[-1]
+          diffs.extend(middle)
+          diffs.extend(diffs_b)
+          self.diff_finishStep(diffs, commonprefix, commonsuffix, node,
+                               deadline)
+          continue
+
+        (text1, text2, checklines, level) = task
+        # Check for equality (speedup).
+        if text1 == text2:
+          if text1:
+            results.append([(self.DIFF_EQUAL, text1)])
+          else:
+            results.append([])
+          continue
+
+        # Trim off common prefix and suffix (speedup), copying the middle
+        # block of each text once.  The suffix may not overlap the prefix.
+        prefixlength = self.diff_commonPrefix(text1, text2)
+        suffixlength = min(self.diff_commonSuffix(text1, text2),
+                           min(len(text1), len(text2)) - prefixlength)
+        commonprefix = text1[:prefixlength]
+        commonsuffix = text1[len(text1) - suffixlength:]
+        text1 = text1[prefixlength:len(text1) - suffixlength]
+        text2 = text2[prefixlength:len(text2) - suffixlength]
+
+        # Compute the diff on the middle block.
+        node = None
+        if self.Diff_Trace is not None:
+          self.Diff_TraceDepth = level
+          node = (level, len(text1), len(text2), checklines, time.time())
+        step = self.diff_computeStep(text1, text2, checklines, deadline)
+        if isinstance(step, list):
+          self.diff_finishStep(step, commonprefix, commonsuffix, node,
+                               deadline)
+          results.append(step)
+        else:
+          (text1_a, text2_a, middle, text1_b, text2_b, checklines) = step
+          work.append((None, middle, commonprefix, commonsuffix, node))
+          work.append((text1_b, text2_b, checklines, level + 1))
+          work.append((text1_a, text2_a, checklines, level + 1))
+    finally:
+      self.Diff_TraceDepth = depth
+    return results[0]
+
+  def diff_finishStep(self, diffs, commonprefix, commonsuffix, node,
+                      deadline):
+    """Complete the diff of a pair of texts in diff_main: report a "compute"
+    event when tracing, restore the common prefix and suffix and merge.
 
-    # Compute the diff on the middle block.
-    diffs = self.diff_compute(text1, text2, checklines, deadline)
+    Args:
+      diffs: Array of diff tuples of the middle blocks, modified in place.
+      commonprefix: Common prefix trimmed off the texts.
+      commonsuffix: Common suffix trimmed off the texts.
+      node: Tuple of the depth, the lengths of the middle blocks, the
+        checklines flag and the start time when tracing, else None.
+      deadline: Time when the diff should be complete by.
+    """
+    if node != None:
+      (level, length1, length2, checklines, start) = node
+      self.Diff_TraceDepth = level
+      self.diff_trace("compute", length1=length1, length2=length2,
+                      prefix=len(commonprefix), suffix=len(commonsuffix),
+                      checklines=checklines, timeout=time.time() > deadline,
+                      seconds=time.time() - start)
 
     # Restore the prefix and suffix.
     if commonprefix:
@@ -134,7 +269,17 @@ class diff_match_patch:
     if commonsuffix:
       diffs.append((self.DIFF_EQUAL, commonsuffix))
     self.diff_cleanupMerge(diffs)
-    return diffs
+
+  def diff_trace(self, event, **info):
+    """Report an event to the Diff_Trace function.
+
+    Args:
+      event: Name of the event: "compute", "shortcut", "halfMatch", "lineMode",
+        "bisect", "onp" or "bitParallel".
+      **info: Sizes and timings of the event.
+    """
+    info["depth"] = self.Diff_TraceDepth
+    self.Diff_Trace(event, info)
 
   def diff_compute(self, text1, text2, checklines, deadline):
     """Find the differences between two texts.  Assumes that the texts do not
@@ -151,12 +296,42 @@ class diff_match_patch:
     Returns:
       Array of changes.
     """
+    step = self.diff_computeStep(text1, text2, checklines, deadline)
+    if isinstance(step, list):
+      return step
+    (text1_a, text2_a, middle, text1_b, text2_b, checklines) = step
+    return (self.diff_main(text1_a, text2_a, checklines, deadline) + middle +
+            self.diff_main(text1_b, text2_b, checklines, deadline))
+
+  def diff_computeStep(self, text1, text2, checklines, deadline):
+    """Find the differences between two texts, or how to split the problem
+      in two.  Assumes that the texts do not have any common prefix or suffix.
+
+    Args:
+      text1: Old string to be diffed.
+      text2: New string to be diffed.
+      checklines: Speedup flag.  If false, then don't run a line-level diff
+        first to identify the changed areas.
+        If true, then run a faster, slightly less optimal diff.
+      deadline: Time when the diff should be complete by.
+
+    Returns:
+      Array of changes, or a tuple of the first part of each text, the array
+      of changes between the parts, the second part of each text and the
+      checklines flag to diff the parts with.
+    """
     if not text1:
       # Just add some text (speedup).
+      if self.Diff_Trace is not None:
+        self.diff_trace("shortcut", kind="insert", length1=0,
+                        length2=len(text2))
       return [(self.DIFF_INSERT, text2)]
 
     if not text2:
       # Just delete some text (speedup).
+      if self.Diff_Trace is not None:
+        self.diff_trace("shortcut", kind="delete", length1=len(text1),
+                        length2=0)
       return [(self.DIFF_DELETE, text1)]
 
     if len(text1) > len(text2):
@@ -166,6 +341,9 @@ class diff_match_patch:
     i = longtext.find(shorttext)
     if i != -1:
       # Shorter text is inside the longer text (speedup).
+      if self.Diff_Trace is not None:
+        self.diff_trace("shortcut", kind="contains", length1=len(text1),
+                        length2=len(text2))
       diffs = [(self.DIFF_INSERT, longtext[:i]), (self.DIFF_EQUAL, shorttext),
                (self.DIFF_INSERT, longtext[i + len(shorttext):])]
       # Swap insertions for deletions if diff is reversed.
@@ -177,24 +355,56 @@ class diff_match_patch:
     if len(shorttext) == 1:
       # Single character string.
       # After the previous speedup, the character can't be an equality.
+      if self.Diff_Trace is not None:
+        self.diff_trace("shortcut", kind="single", length1=len(text1),
+                        length2=len(text2))
       return [(self.DIFF_DELETE, text1), (self.DIFF_INSERT, text2)]
     longtext = shorttext = None  # Garbage collect.
 
+    if (self.Diff_Map != None and
+        len(text1) + len(text2) > self.Diff_ParallelChars):
+      # Diff the segments between unique common lines in parallel.
+      diffs = self.diff_parallel(text1, text2, checklines, deadline)
+      if diffs != None:
+        return diffs
+
     # Check to see if the problem can be split in two.
+    if self.Diff_Trace is not None:
+      start = time.time()
     hm = self.diff_halfMatch(text1, text2)
+    if self.Diff_Trace is not None:
+      self.diff_trace("halfMatch", length1=len(text1), length2=len(text2),
+                      common=hm and len(hm[4]) or 0,
+                      seconds=time.time() - start)
     if hm:
       # A half-match was found, sort out the return data.
       (text1_a, text1_b, text2_a, text2_b, mid_common) = hm
       # Send both pairs off for separate processing.
-      diffs_a = self.diff_main(text1_a, text2_a, checklines, deadline)
-      diffs_b = self.diff_main(text1_b, text2_b, checklines, deadline)
-      # Merge the results.
-      return diffs_a + [(self.DIFF_EQUAL, mid_common)] + diffs_b
+      return (text1_a, text2_a, [(self.DIFF_EQUAL, mid_common)],
+              text1_b, text2_b, checklines)
 
     if checklines and len(text1) > 100 and len(text2) > 100:
       return self.diff_lineMode(text1, text2, deadline)
 
-    return self.diff_bisect(text1, text2, deadline)
+    algorithm = self.diff_algorithm(text1, text2)
+    if algorithm == "bitparallel" or algorithm == "onp":
+      if algorithm == "bitparallel":
+        diffs = self.diff_bitParallel(text1, text2, deadline)
+      else:
+        diffs = self.diff_onp(text1, text2, deadline)
+      if diffs == None:
+        # Diff took too long and hit the deadline.
+        return [(self.DIFF_DELETE, text1), (self.DIFF_INSERT, text2)]
+      return diffs
+
+    point = self.diff_bisectSnake(text1, text2, deadline)
+    if point == None:
+      # Diff took too long and hit the deadline or
+      # number of diffs equals number of characters, no commonality at all.
+      return [(self.DIFF_DELETE, text1), (self.DIFF_INSERT, text2)]
+    # Split the diff at the 'middle snake'.
+    (x, y) = point
+    return (text1[:x], text2[:y], [], text1[x:], text2[y:], False)
 
   def diff_lineMode(self, text1, text2, deadline):
     """Do a quick line-level diff on both strings, then rediff the parts for
@@ -210,49 +420,523 @@ class diff_match_patch:
       Array of changes.
     """
 
+    if self.Diff_Trace is not None:
+      self.diff_trace("lineMode", length1=len(text1), length2=len(text2))
+
     # Scan the text on a line-by-line basis first.
-    (text1, text2, linearray) = self.diff_linesToChars(text1, text2)
+    encoder = self.Diff_LineEncoder
+    if encoder == None:
+      encoder = sequence_encoder()
+    ids1 = encoder.encode_lines(text1)
+    ids2 = encoder.encode_lines(text2)
 
-    diffs = self.diff_main(text1, text2, False, deadline)
+    diffs = self.diff_lineIds(ids1, ids2, deadline)
 
     # Convert the diff back to original text.
-    self.diff_charsToLines(diffs, linearray)
+    self.diff_charsToItems(diffs, ids1, ids2, encoder.items)
     # Eliminate freak matches (e.g. blank lines)
     self.diff_cleanupSemantic(diffs)
 
     # Rediff any replacement blocks, this time character-by-character.
-    # Add a dummy entry at the end.
-    diffs.append((self.DIFF_EQUAL, ''))
-    pointer = 0
+    # The blocks are collected first, leaving None in their place, then put
+    # back rediffed in one pass.
+    result = []
+    blocks = []
+    edits = []
     count_delete = 0
-    count_insert = 0
-    text_delete = ''
-    text_insert = ''
-    while pointer < len(diffs):
-      if diffs[pointer][0] == self.DIFF_INSERT:
-        count_insert += 1
-        text_insert += diffs[pointer][1]
-      elif diffs[pointer][0] == self.DIFF_DELETE:
-        count_delete += 1
-        text_delete += diffs[pointer][1]
-      elif diffs[pointer][0] == self.DIFF_EQUAL:
-        # Upon reaching an equality, check for prior redundancies.
-        if count_delete >= 1 and count_insert >= 1:
-          # Delete the offending records and add the merged ones.
-          a = self.diff_main(text_delete, text_insert, False, deadline)
-          diffs[pointer - count_delete - count_insert : pointer] = a
-          pointer = pointer - count_delete - count_insert + len(a)
-        count_insert = 0
-        count_delete = 0
-        text_delete = ''
-        text_insert = ''
-
-      pointer += 1
-
-    diffs.pop()  # Remove the dummy entry at the end.
+    # Add a dummy entry at the end.
+    for diff in diffs + [(self.DIFF_EQUAL, '')]:
+      if diff[0] != self.DIFF_EQUAL:
+        edits.append(diff)
+        if diff[0] == self.DIFF_DELETE:
+          count_delete += 1
+        continue
+      # Upon reaching an equality, check for prior redundancies.
+      if count_delete >= 1 and len(edits) - count_delete >= 1:
+        blocks.append((self,
+            "".join([x[1] for x in edits if x[0] == self.DIFF_DELETE]),
+            "".join([x[1] for x in edits if x[0] == self.DIFF_INSERT]),
+            deadline))
+        result.append(None)
+      else:
+        result.extend(edits)
+      result.append(diff)
+      edits = []
+      count_delete = 0
+    result.pop()  # Remove the dummy entry at the end.
+
+    if not blocks:
+      return result
+    rediffs = list((self.Diff_Map or map)(diff_rediffBlock, blocks))
+    diffs = []
+    block = 0
+    for diff in result:
+      if diff == None:
+        diffs.extend(rediffs[block])
+        block += 1
+      else:
+        diffs.append(diff)
+    return diffs
+
+  def diff_parallel(self, text1, text2, checklines, deadline):
+    """Split two texts at lines occurring once in each, matched in order as
+      by diff_patience, into pairs of segments of about Diff_ParallelChars
+      characters, and diff the pairs through Diff_Map.
+      This speedup can produce non-minimal diffs.
+
+    Args:
+      text1: Old string to be diffed.
+      text2: New string to be diffed.
+      checklines: Speedup flag to diff the segments with.
+      deadline: Time when the diff should be complete by.
+
+    Returns:
+      Array of changes, or None if the texts can't be split.
+    """
+    encoder = sequence_encoder()
+    ids1 = encoder.encode_lines(text1)
+    ids2 = encoder.encode_lines(text2)
+    lengths = [len(item) for item in encoder.items]
+    encoder = None  # Garbage collect.
+    cuts = self.diff_parallelCuts(ids1, ids2, lengths)
+    if not cuts:
+      return None
+
+    blocks = []
+    (start1, start2) = (0, 0)
+    for (index1, index2, end1, end2) in cuts:
+      blocks.append((self, text1[start1:end1], text2[start2:end2],
+                     checklines, deadline))
+      (start1, start2) = (end1, end2)
+    blocks.append((self, text1[start1:], text2[start2:], checklines,
+                   deadline))
+
+    diffs = []
+    for segment in self.Diff_Map(diff_mainBlock, blocks):
+      diffs.extend(segment)
+    return diffs
+
+  def diff_parallelIds(self, ids1, ids2, lengths, deadline=None):
+    """Split two arrays of line ids as diff_parallel splits texts, and diff
+      the pairs of segments through Diff_Map with diff_lineIds.
+
+    Args:
+      ids1: Old array of ids.
+      ids2: New array of ids.
+      lengths: Array of the length of each line, by id.
+      deadline: Optional time when the diff should be complete by.
+
+    Returns:
+      Array of changes, to be rehydrated with diff_charsToItems, or None if
+      the arrays can't be split.
+    """
+    cuts = self.diff_parallelCuts(ids1, ids2, lengths)
+    if not cuts:
+      return None
+
+    blocks = []
+    (start1, start2) = (0, 0)
+    for (index1, index2, end1, end2) in cuts:
+      blocks.append((self, ids1[start1:index1], ids2[start2:index2],
+                     deadline))
+      (start1, start2) = (index1, index2)
+    blocks.append((self, ids1[start1:], ids2[start2:], deadline))
+
+    diffs = []
+    for segment in self.Diff_Map(diff_lineIdsBlock, blocks):
+      for (op, data) in segment:
+        if diffs and diffs[-1][0] == op:
+          # An equality across the cut.
+          diffs[-1] = (op, diffs[-1][1] + data)
+        else:
+          diffs.append((op, data))
+    return diffs
+
+  def diff_parallelCuts(self, ids1, ids2, lengths):
+    """Find where to split two arrays of line ids into pairs of segments of
+      about Diff_ParallelChars characters, before lines occurring once in
+      each, matched in order as by diff_patience.
+
+    Args:
+      ids1: First array of ids.
+      ids2: Second array of ids.
+      lengths: Array of the length of each line, by id.
+
+    Returns:
+      Array of (index in ids1, index in ids2, offset in text1, offset in
+      text2) tuples, the character offsets being those of the lines.
+    """
+    cuts = []
+    (start1, start2) = (0, 0)
+    (index1, index2) = (0, 0)
+    (offset1, offset2) = (0, 0)
+    for (anchor1, anchor2, length) in self.diff_patienceAnchors(ids1, ids2):
+      # Character offsets of the anchor lines.
+      for itemId in ids1[index1:anchor1]:
+        offset1 += lengths[itemId]
+      for itemId in ids2[index2:anchor2]:
+        offset2 += lengths[itemId]
+      (index1, index2) = (anchor1, anchor2)
+      if offset1 - start1 + offset2 - start2 >= self.Diff_ParallelChars:
+        cuts.append((index1, index2, offset1, offset2))
+        (start1, start2) = (offset1, offset2)
+    return cuts
+
+  def diff_lineChars(self, text1, text2, deadline=None):
+    """Find the differences between two texts of line chars, as encoded by
+      diff_linesToChars, with the Diff_LineAlgorithm.
+
+    Args:
+      text1: Old string of line chars.
+      text2: New string of line chars.
+      deadline: Optional time when the diff should be complete by.
+
+    Returns:
+      Array of changes.
+    """
+    if self.Diff_LineAlgorithm == "myers":
+      return self.diff_main(text1, text2, False, deadline)
+    if self.Diff_LineAlgorithm == "patience":
+      return self.diff_patience(text1, text2, deadline)
+    if self.Diff_LineAlgorithm == "histogram":
+      return self.diff_histogram(text1, text2, deadline)
+    raise ValueError("Unknown line algorithm: " + self.Diff_LineAlgorithm)
+
+  def diff_lineIds(self, ids1, ids2, deadline=None):
+    """Find the differences between two arrays of line ids with the
+      Diff_LineAlgorithm, through the strings of diff_idsToChars, or with
+      diff_ids when their common ids outnumber the code points.
+
+    Args:
+      ids1: Old array of ids.
+      ids2: New array of ids.
+      deadline: Optional time when the diff should be complete by.
+
+    Returns:
+      Array of changes, to be rehydrated with diff_charsToItems.
+    """
+    chars = self.diff_idsToChars(ids1, ids2)
+    if chars == None:
+      return self.diff_ids(ids1, ids2, deadline)
+    return self.diff_lineChars(chars[0], chars[1], deadline)
+
+  def diff_ids(self, ids1, ids2, deadline=None):
+    """Find the differences between two arrays of ids on the arrays
+      themselves, whatever the number of distinct ids: the blocks matched by
+      the patience or histogram Diff_LineAlgorithm, then the middle snakes of
+      diff_bisectSnake, split the arrays until they differ entirely.
+
+    Args:
+      ids1: Old array of ids.
+      ids2: New array of ids.
+      deadline: Optional time when the diff should be complete by.
+
+    Returns:
+      Array of changes, whose data are slices of the arrays.
+    """
+    if deadline == None:
+      if self.Diff_Timeout <= 0:
+        deadline = sys.maxsize
+      else:
+        deadline = time.time() + self.Diff_Timeout
+
+    if self.Diff_LineAlgorithm == "myers":
+      anchors = None
+    elif self.Diff_LineAlgorithm == "patience":
+      anchors = self.diff_patienceAnchors
+    elif self.Diff_LineAlgorithm == "histogram":
+      anchors = self.diff_histogramAnchors
+    else:
+      raise ValueError("Unknown line algorithm: " + self.Diff_LineAlgorithm)
+
+    diffs = []
+    # Parts left, the next one last, as in diff_anchored.
+    parts = [(None, ids1, ids2)]
+    while parts:
+      (op, ids1, ids2) = parts.pop()
+      if op == None:
+        # Trim off common prefix and suffix.
+        commonlength = self.diff_commonPrefix(ids1, ids2)
+        if commonlength:
+          parts.append((None, ids1[commonlength:], ids2[commonlength:]))
+          op = self.DIFF_EQUAL
+          ids1 = ids1[:commonlength]
+        else:
+          commonlength = self.diff_commonSuffix(ids1, ids2)
+          if commonlength:
+            parts.append((self.DIFF_EQUAL, ids1[-commonlength:], None))
+            parts.append((None, ids1[:-commonlength], ids2[:-commonlength]))
+            continue
+
+      if op == None and ids1 and ids2 and time.time() <= deadline:
+        blocks = anchors and anchors(ids1, ids2)
+        if blocks:
+          pointer1 = len(ids1)
+          pointer2 = len(ids2)
+          for (index1, index2, length) in reversed(blocks):
+            parts.append((None, ids1[index1 + length:pointer1],
+                          ids2[index2 + length:pointer2]))
+            parts.append((self.DIFF_EQUAL, ids1[index1:index1 + length],
+                          None))
+            (pointer1, pointer2) = (index1, index2)
+          parts.append((None, ids1[:pointer1], ids2[:pointer2]))
+          continue
+        if len(ids1) == 1:
+          # Too short to bisect, as in diff_compute.
+          point = ids1[0] in ids2 and (0, list(ids2).index(ids1[0])) or None
+        elif len(ids2) == 1:
+          point = ids2[0] in ids1 and (list(ids1).index(ids2[0]), 0) or None
+        else:
+          point = self.diff_bisectSnake(ids1, ids2, deadline)
+        if point != None:
+          (x, y) = point
+          parts.append((None, ids1[x:], ids2[y:]))
+          parts.append((None, ids1[:x], ids2[:y]))
+          continue
+
+      if op != None:
+        changes = [(op, ids1)]
+      else:
+        # Nothing in common, or out of time.
+        changes = [(self.DIFF_DELETE, ids1), (self.DIFF_INSERT, ids2)]
+      for (op, ids) in changes:
+        if not ids:
+          continue
+        if diffs and diffs[-1][0] == op:
+          # Extended in place, for the many blocks of patience.
+          merged = diffs[-1][1]
+          merged += ids
+          diffs[-1] = (op, merged)
+        else:
+          diffs.append((op, ids[:]))
+    return diffs
 
+  def diff_sequences(self, seq1, seq2, deadline=None):
+    """Find the differences between two sequences of hashable items, such as
+      lists, tuples or arrays, each item being compared as a whole like the
+      lines of diff_lineMode, with the Diff_LineAlgorithm run on their ids by
+      diff_ids.
+
+    Args:
+      seq1: Old sequence to be diffed.
+      seq2: New sequence to be diffed.
+      deadline: Optional time when the diff should be complete by.
+
+    Returns:
+      Array of opcodes, as returned by diff_toOpcodes.
+    """
+    encoder = sequence_encoder()
+    ids1 = encoder.encode(seq1)
+    ids2 = encoder.encode(seq2)
+    return self.diff_toOpcodes(self.diff_ids(ids1, ids2, deadline))
+
+  def diff_patience(self, text1, text2, deadline=None):
+    """Find the differences between two texts of line chars with the patience
+      algorithm: the lines occurring once in both texts are matched in the
+      longest sequence keeping their order, and the texts between them are
+      diffed the same way, falling back to diff_main when no such line is
+      left.
+
+    Args:
+      text1: Old string of line chars.
+      text2: New string of line chars.
+      deadline: Optional time when the diff should be complete by.
+
+    Returns:
+      Array of changes.
+    """
+    return self.diff_anchored(text1, text2, self.diff_patienceAnchors,
+                              deadline)
+
+  def diff_histogram(self, text1, text2, deadline=None):
+    """Find the differences between two texts of line chars with the histogram
+      algorithm: the common block containing the least frequent lines of
+      text1, the longest among equals, is matched and the texts on each side
+      of it are diffed the same way, falling back to diff_main when the
+      lines left are all more frequent than Diff_HistogramMaxChain.
+
+    Args:
+      text1: Old string of line chars.
+      text2: New string of line chars.
+      deadline: Optional time when the diff should be complete by.
+
+    Returns:
+      Array of changes.
+    """
+    return self.diff_anchored(text1, text2, self.diff_histogramAnchors,
+                              deadline)
+
+  def diff_anchored(self, text1, text2, anchors, deadline):
+    """Find the differences between two texts by matching the blocks given by
+      anchors first and diffing the texts between them the same way.
+
+    Args:
+      text1: Old string to be diffed.
+      text2: New string to be diffed.
+      anchors: Function returning the Array of common blocks of two texts
+        without common prefix or suffix, as (index in text1, index in text2,
+        length) tuples in order, or an empty Array to fall back to diff_main.
+      deadline: Time when the diff should be complete by, or None.
+
+    Returns:
+      Array of changes.
+    """
+    if deadline == None:
+      if self.Diff_Timeout <= 0:
+        deadline = sys.maxsize
+      else:
+        deadline = time.time() + self.Diff_Timeout
+
+    diffs = []
+    # Parts left, the next one last: (None, text1, text2) for texts to diff
+    # or (op, text, None) for the changes found.
+    parts = [(None, text1, text2)]
+    while parts:
+      (op, text1, text2) = parts.pop()
+      if op != None:
+        diffs.append((op, text1))
+        continue
+
+      # Trim off common prefix and suffix.
+      commonlength = self.diff_commonPrefix(text1, text2)
+      if commonlength:
+        diffs.append((self.DIFF_EQUAL, text1[:commonlength]))
+        text1 = text1[commonlength:]
+        text2 = text2[commonlength:]
+      commonlength = self.diff_commonSuffix(text1, text2)
+      if commonlength:
+        parts.append((self.DIFF_EQUAL, text1[-commonlength:], None))
+        text1 = text1[:-commonlength]
+        text2 = text2[:-commonlength]
+
+      if not text1 or not text2 or time.time() > deadline:
+        if text1:
+          diffs.append((self.DIFF_DELETE, text1))
+        if text2:
+          diffs.append((self.DIFF_INSERT, text2))
+        continue
+
+      blocks = anchors(text1, text2)
+      if not blocks:
+        diffs.extend(self.diff_main(text1, text2, False, deadline))
+        continue
+
+      pointer1 = len(text1)
+      pointer2 = len(text2)
+      for (index1, index2, length) in reversed(blocks):
+        parts.append((None, text1[index1 + length:pointer1],
+                      text2[index2 + length:pointer2]))
+        parts.append((self.DIFF_EQUAL, text1[index1:index1 + length], None))
+        (pointer1, pointer2) = (index1, index2)
+      parts.append((None, text1[:pointer1], text2[:pointer2]))
+
+    self.diff_cleanupMerge(diffs)
     return diffs
 
+  def diff_patienceAnchors(self, text1, text2):
+    """Find the characters occurring once in each text, in the longest
+    sequence keeping their order in both.
+
+    Args:
+      text1: First string.
+      text2: Second string.
+
+    Returns:
+      Array of (index in text1, index in text2, 1) tuples.
+    """
+    unique1 = {}
+    for (i, char) in enumerate(text1):
+      if char in unique1:
+        unique1[char] = -1
+      else:
+        unique1[char] = i
+    unique2 = {}
+    for (i, char) in enumerate(text2):
+      if char in unique2:
+        unique2[char] = -1
+      else:
+        unique2[char] = i
+
+    pairs = [(index2, unique1[char]) for (char, index2) in unique2.items()
+             if index2 != -1 and unique1.get(char, -1) != -1]
+    pairs.sort()
+
+    # Patience sorting of the indexes in text1, in the order of text2.
+    tops = []
+    top_pairs = []
+    previous = []
+    for (n, (index2, index1)) in enumerate(pairs):
+      pile = bisect.bisect_left(tops, index1)
+      if pile == len(tops):
+        tops.append(index1)
+        top_pairs.append(n)
+      else:
+        tops[pile] = index1
+        top_pairs[pile] = n
+      if pile:
+        previous.append(top_pairs[pile - 1])
+      else:
+        previous.append(-1)
+
+    anchors = []
+    if top_pairs:
+      n = top_pairs[-1]
+      while n != -1:
+        (index2, index1) = pairs[n]
+        anchors.append((index1, index2, 1))
+        n = previous[n]
+      anchors.reverse()
+    return anchors
+
+  def diff_histogramAnchors(self, text1, text2):
+    """Find the common block of the texts containing the least frequent
+    characters of text1, the longest among equals.
+
+    Args:
+      text1: First string.
+      text2: Second string.
+
+    Returns:
+      Array of one (index in text1, index in text2, length) tuple, or empty
+      if all the common characters occur more than Diff_HistogramMaxChain
+      times in text1.
+    """
+    positions = {}
+    for (i, char) in enumerate(text1):
+      positions.setdefault(char, []).append(i)
+
+    best = []
+    best_count = self.Diff_HistogramMaxChain + 1
+    best_length = 0
+    index2 = 0
+    while index2 < len(text2):
+      next_index2 = index2 + 1
+      occurrences = positions.get(text2[index2])
+      if (occurrences != None and len(occurrences) <= best_count and
+          len(occurrences) <= self.Diff_HistogramMaxChain):
+        for index1 in occurrences:
+          # Extend the match both ways.
+          (start1, start2) = (index1, index2)
+          while (start1 > 0 and start2 > 0 and
+                 text1[start1 - 1] == text2[start2 - 1]):
+            start1 -= 1
+            start2 -= 1
+          (end1, end2) = (index1 + 1, index2 + 1)
+          while (end1 < len(text1) and end2 < len(text2) and
+                 text1[end1] == text2[end2]):
+            end1 += 1
+            end2 += 1
+          next_index2 = max(next_index2, end2)
+
+          count = min([len(positions[char]) for char in text1[start1:end1]])
+          if (count < best_count or
+              count == best_count and end1 - start1 > best_length):
+            best = [(start1, start2, end1 - start1)]
+            best_count = count
+            best_length = end1 - start1
+      index2 = next_index2
+    return best
+
   def diff_bisect(self, text1, text2, deadline):
     """Find the 'middle snake' of a diff, split the problem in two
       and return the recursively constructed diff.
@@ -266,14 +950,35 @@ class diff_match_patch:
     Returns:
       Array of diff tuples.
     """
+    point = self.diff_bisectSnake(text1, text2, deadline)
+    if point == None:
+      # Diff took too long and hit the deadline or
+      # number of diffs equals number of characters, no commonality at all.
+      return [(self.DIFF_DELETE, text1), (self.DIFF_INSERT, text2)]
+    return self.diff_bisectSplit(text1, text2, point[0], point[1], deadline)
+
+  def diff_bisectSnake(self, text1, text2, deadline):
+    """Find the 'middle snake' of a diff, where diff_bisect splits it.
+
+    Args:
+      text1: Old string to be diffed.
+      text2: New string to be diffed.
+      deadline: Time at which to bail if not yet complete.
+
+    Returns:
+      Tuple of the indices of the split point in text1 and text2, or None if
+      the deadline was reached or the texts have nothing in common.
+    """
 
     # Cache the text lengths to prevent multiple calls.
     text1_length = len(text1)
     text2_length = len(text2)
     max_d = (text1_length + text2_length + 1) / 2
-    v_offset = max_d
-    v_length = 2 * max_d
-    v1 = [-1] * v_length
+    # The V vectors only cover the diagonals walked so far, from -v_offset,
+    # and are widened as the walk goes on.
+    v_offset = min(max_d, 64)
+    v_length = 2 * v_offset
+    v1 = array.array("i", [-1]) * v_length
     v1[v_offset + 1] = 0
     v2 = v1[:]
     delta = text1_length - text2_length
@@ -286,11 +991,50 @@ class diff_match_patch:
     k1end = 0
     k2start = 0
     k2end = 0
+    # Step from which the paths are walked with NumPy, if ever.
+    numpy_d = -1
+    if numpy is not None and self.Diff_NumPySteps > 0:
+      numpy_d = self.Diff_NumPySteps
+    # Step from which the middle snake is no longer looked for, if ever.
+    max_cost = max_d
+    if self.Diff_BisectCost > 0:
+      max_cost = self.Diff_BisectCost
+    start = None
+    if self.Diff_Trace is not None:
+      start = time.time()
     for d in xrange(max_d):
       # Bail out if deadline is reached.
       if time.time() > deadline:
+        if self.Diff_Trace is not None:
+          self.diff_traceBisect(text1, text2, d, True, start)
         break
 
+      if d >= max_cost:
+        # Too expensive, split at the furthest point reached.
+        point = self.diff_bisectFurthest(text1_length, text2_length,
+                                         v1, v2, v_offset)
+        if point != None:
+          if self.Diff_Trace is not None:
+            self.diff_traceBisect(text1, text2, d, False, start, True)
+          return point
+
+      if d == v_offset:
+        # Widen the V vectors to the diagonals about to be walked.
+        new_offset = min(max_d, 2 * v_offset)
+        v1 = self.diff_bisectWiden(v1, v_offset, new_offset)
+        v2 = self.diff_bisectWiden(v2, v_offset, new_offset)
+        v_offset = new_offset
+        v_length = 2 * v_offset
+
+      if d == numpy_d:
+        # Many diagonals to walk, carry on with NumPy.
+        array1 = self.diff_numPyArray(text1)
+        array2 = self.diff_numPyArray(text2)
+        if array1 is not None and array2 is not None:
+          return self.diff_bisectNumPy(text1, text2, array1, array2, deadline,
+                                       d, v1, v2, v_offset,
+                                       (k1start, k1end, k2start, k2end), start)
+
       # Walk the front path one step.
       for k1 in xrange(-d + k1start, d + 1 - k1end, 2):
         k1_offset = v_offset + k1
@@ -318,7 +1062,9 @@ class diff_match_patch:
             x2 = text1_length - v2[k2_offset]
             if x1 >= x2:
               # Overlap detected.
-              return self.diff_bisectSplit(text1, text2, x1, y1, deadline)
+              if self.Diff_Trace is not None:
+                self.diff_traceBisect(text1, text2, d + 1, False, start)
+              return (x1, y1)
 
       # Walk the reverse path one step.
       for k2 in xrange(-d + k2start, d + 1 - k2end, 2):
@@ -349,11 +1095,304 @@ class diff_match_patch:
             x2 = text1_length - x2
             if x1 >= x2:
               # Overlap detected.
-              return self.diff_bisectSplit(text1, text2, x1, y1, deadline)
+              if self.Diff_Trace is not None:
+                self.diff_traceBisect(text1, text2, d + 1, False, start)
+              return (x1, y1)
+
+    else:
+      if self.Diff_Trace is not None:
+        self.diff_traceBisect(text1, text2, max_d, False, start)
+
+    return None
+
+  def diff_bisectFurthest(self, text1_length, text2_length, v1, v2,
+                          v_offset):
+    """Find the point furthest from its corner reached by either path of
+    diff_bisect, where a diff too expensive to finish may be split.
+
+    Args:
+      text1_length: Length of the old string.
+      text2_length: Length of the new string.
+      v1: Array of the furthest x reached on each diagonal of the front path.
+      v2: Same for the reverse path.
+      v_offset: Index of diagonal 0 in v1 and v2.
+
+    Returns:
+      Tuple of the indices of the split point in text1 and text2, or None if
+      no point inside the texts has been reached yet.
+    """
+    length = text1_length + text2_length
+    point = None
+    best = 0
+    for k_offset in xrange(len(v1)):
+      x1 = v1[k_offset]
+      y1 = x1 - k_offset + v_offset
+      if (0 <= x1 <= text1_length and 0 <= y1 <= text2_length and
+          best < x1 + y1 < length):
+        point = (x1, y1)
+        best = x1 + y1
+    for k_offset in xrange(len(v2)):
+      x2 = v2[k_offset]
+      y2 = x2 - k_offset + v_offset
+      if (0 <= x2 <= text1_length and 0 <= y2 <= text2_length and
+          best < x2 + y2 < length):
+        # Mirror onto top-left coordinate system.
+        point = (text1_length - x2, text2_length - y2)
+        best = x2 + y2
+    return point
+
+  def diff_bisectWiden(self, v, v_offset, new_offset):
+    """Widen a V vector of diff_bisect to more diagonals.
+
+    Args:
+      v: Array of the furthest x reached on diagonals -v_offset to v_offset.
+      v_offset: Index of diagonal 0 in v.
+      new_offset: Index of diagonal 0 in the widened vector.
+
+    Returns:
+      Array of the furthest x reached on diagonals -new_offset to new_offset.
+    """
+    widened = array.array(v.typecode, [-1]) * (2 * new_offset)
+    widened[new_offset - v_offset:new_offset + v_offset] = v
+    return widened
+
+  def diff_bisectNumPy(self, text1, text2, array1, array2, deadline, d_start,
+                       v1, v2, v_offset, k_bounds, start):
+    """Carry on diff_bisectSnake from step d_start, walking all the diagonals
+      of each step at once as operations on NumPy arrays.  Finds the same
+      'middle snake'.
+
+    Args:
+      text1: Old string to be diffed.
+      text2: New string to be diffed.
+      array1: text1 as returned by diff_numPyArray.
+      array2: text2 as returned by diff_numPyArray.
+      deadline: Time at which to bail if not yet complete.
+      d_start: Step to carry on from.
+      v1: Array of the furthest x reached on each diagonal of the front path.
+      v2: Same for the reverse path.
+      v_offset: Index of diagonal 0 in v1 and v2.
+      k_bounds: Tuple of k1start, k1end, k2start and k2end.
+      start: Time when diff_bisectSnake started, for tracing.
+
+    Returns:
+      Tuple of the indices of the split point in text1 and text2, or None if
+      the deadline was reached or the texts have nothing in common.
+    """
+    reverse1 = array1[::-1]
+    reverse2 = array2[::-1]
+
+    text1_length = len(text1)
+    text2_length = len(text2)
+    max_d = (text1_length + text2_length + 1) / 2
+    v_length = 2 * v_offset
+    # One more entry on each side, so that the neighbours of the outer
+    # diagonals can be read with the others.  Diagonal k is at v_base + k.
+    v_base = v_offset + 1
+    v1 = self.diff_numPyWiden(v1, v_offset, v_offset)
+    v2 = self.diff_numPyWiden(v2, v_offset, v_offset)
+    delta = text1_length - text2_length
+    # If the total number of characters is odd, then the front path will
+    # collide with the reverse path.
+    front = (delta % 2 != 0)
+    (k1start, k1end, k2start, k2end) = k_bounds
+    max_cost = max_d
+    if self.Diff_BisectCost > 0:
+      max_cost = self.Diff_BisectCost
+    for d in xrange(d_start, max_d):
+      # Bail out if deadline is reached.
+      if time.time() > deadline:
+        if self.Diff_Trace is not None:
+          self.diff_traceBisect(text1, text2, d, True, start, vectorized=True)
+        break
+
+      if d >= max_cost:
+        # Too expensive, split at the furthest point reached.
+        point = self.diff_bisectFurthest(text1_length, text2_length,
+                                         v1[1:-1].tolist(), v2[1:-1].tolist(),
+                                         v_offset)
+        if point != None:
+          if self.Diff_Trace is not None:
+            self.diff_traceBisect(text1, text2, d, False, start, True,
+                                  vectorized=True)
+          return point
+
+      if d == v_offset:
+        # Widen the V vectors to the diagonals about to be walked.
+        new_offset = min(max_d, 2 * v_offset)
+        v1 = self.diff_numPyWiden(v1[1:-1], v_offset, new_offset)
+        v2 = self.diff_numPyWiden(v2[1:-1], v_offset, new_offset)
+        v_offset = new_offset
+        v_length = 2 * v_offset
+        v_base = v_offset + 1
+
+      # Walk the front path one step.
+      k1 = numpy.arange(-d + k1start, d + 1 - k1end, 2)
+      x1 = self.diff_numPyStep(v1, v_base, k1, d, array1, array2)
+      y1 = x1 - k1
+      off_right = x1 > text1_length
+      off_bottom = ~off_right & (y1 > text2_length)
+      if front:
+        k2_offset = v_offset + delta - k1
+        x2 = v2[numpy.clip(k2_offset, -1, v_length) + 1]
+        # Mirror x2 onto top-left coordinate system.
+        overlap = (~off_right & ~off_bottom & (k2_offset >= 0) &
+                   (k2_offset < v_length) & (x2 != -1) &
+                   (x1 >= text1_length - x2))
+        if overlap.any():
+          i = overlap.argmax()
+          if self.Diff_Trace is not None:
+            self.diff_traceBisect(text1, text2, d + 1, False, start,
+                                  vectorized=True)
+          return (int(x1[i]), int(y1[i]))
+      k1end += 2 * int(off_right.sum())
+      k1start += 2 * int(off_bottom.sum())
+
+      # Walk the reverse path one step.
+      k2 = numpy.arange(-d + k2start, d + 1 - k2end, 2)
+      x2 = self.diff_numPyStep(v2, v_base, k2, d, reverse1, reverse2)
+      y2 = x2 - k2
+      off_left = x2 > text1_length
+      off_top = ~off_left & (y2 > text2_length)
+      if not front:
+        k1_offset = v_offset + delta - k2
+        x1 = v1[numpy.clip(k1_offset, -1, v_length) + 1]
+        y1 = v_offset + x1 - k1_offset
+        # Mirror x2 onto top-left coordinate system.
+        overlap = (~off_left & ~off_top & (k1_offset >= 0) &
+                   (k1_offset < v_length) & (x1 != -1) &
+                   (x1 >= text1_length - x2))
+        if overlap.any():
+          i = overlap.argmax()
+          if self.Diff_Trace is not None:
+            self.diff_traceBisect(text1, text2, d + 1, False, start,
+                                  vectorized=True)
+          return (int(x1[i]), int(y1[i]))
+      k2end += 2 * int(off_left.sum())
+      k2start += 2 * int(off_top.sum())
+
+    else:
+      if self.Diff_Trace is not None:
+        self.diff_traceBisect(text1, text2, max_d, False, start,
+                              vectorized=True)
+
+    return None
+
+  def diff_numPyWiden(self, v, v_offset, new_offset):
+    """Copy a V vector of diff_bisect into a NumPy array covering more
+    diagonals, with one more entry on each side.
+
+    Args:
+      v: Array of the furthest x reached on diagonals -v_offset to v_offset.
+      v_offset: Index of diagonal 0 in v.
+      new_offset: Index of diagonal 0 in the widened vector, less one.
+
+    Returns:
+      NumPy array of the furthest x reached on diagonals -new_offset - 1 to
+      new_offset + 1.
+    """
+    widened = numpy.empty(2 * new_offset + 2, numpy.intp)
+    widened.fill(-1)
+    widened[new_offset - v_offset + 1:new_offset + v_offset + 1] = v
+    return widened
+
+  def diff_numPyArray(self, text):
+    """Convert a string into a NumPy array of its character codes, or an
+    array of ids into a NumPy array.
+
+    Args:
+      text: String or array of ids to convert.
+
+    Returns:
+      Array of integers, or None if the string can't be converted.
+    """
+    if isinstance(text, bytes):
+      return numpy.frombuffer(text, numpy.uint8)
+    if not isinstance(text, unicode):
+      # Array of ids.
+      return numpy.asarray(text)
+    try:
+      array = numpy.frombuffer(text.encode("utf-32-le"), numpy.uint32)
+    except UnicodeError:
+      return None
+    if len(array) != len(text):
+      # Surrogate pairs of a narrow build.
+      return None
+    return array
+
+  def diff_numPyStep(self, v, v_base, k, d, array1, array2):
+    """Walk the diagonals k of a path one step, then follow their snakes.
+
+    Args:
+      v: NumPy array of the furthest x reached on each diagonal, diagonal k
+        being at v_base + k.  Updated for the diagonals k.
+      v_base: Index of diagonal 0 in v.
+      k: NumPy array of the diagonals to walk.
+      d: Step, the number of edits.
+      array1: NumPy array of the old text, reversed for the reverse path.
+      array2: NumPy array of the new text, reversed for the reverse path.
 
-    # Diff took too long and hit the deadline or
-    # number of diffs equals number of characters, no commonality at all.
-    return [(self.DIFF_DELETE, text1), (self.DIFF_INSERT, text2)]
+    Returns:
+      NumPy array of the x reached on the diagonals k.
+    """
+    before = v[v_base + k - 1]
+    after = v[v_base + k + 1]
+    x = numpy.where((k == -d) | ((k != d) & (before < after)), after,
+                    before + 1)
+    self.diff_numPySnake(x, x - k, array1, array2)
+    v[v_base + k] = x
+    return x
+
+  def diff_numPySnake(self, x, y, array1, array2):
+    """Follow the diagonals from (x, y) as long as the texts match.
+
+    Args:
+      x: NumPy array of the positions in array1, advanced in place.
+      y: NumPy array of the positions in array2, on the same diagonals.
+      array1: NumPy array of the old text.
+      array2: NumPy array of the new text.
+    """
+    length1 = len(array1)
+    length2 = len(array2)
+    active = numpy.flatnonzero((x < length1) & (y < length2))
+    # Advance all the diagonals one character at a time while there are many.
+    while len(active) > 8:
+      active = active[array1[x[active]] == array2[y[active]]]
+      x[active] += 1
+      y[active] += 1
+      active = active[(x[active] < length1) & (y[active] < length2)]
+    # Then compare growing blocks of the few remaining ones.
+    for i in active:
+      (xi, yi) = (int(x[i]), int(y[i]))
+      block = 64
+      while xi < length1 and yi < length2:
+        n = min(block, length1 - xi, length2 - yi)
+        mismatch = numpy.flatnonzero(array1[xi:xi + n] != array2[yi:yi + n])
+        if len(mismatch):
+          xi += int(mismatch[0])
+          break
+        xi += n
+        yi += n
+        block *= 2
+      x[i] = xi
+
+  def diff_traceBisect(self, text1, text2, iterations, timeout, start,
+                       expensive=False, vectorized=False):
+    """Report a "bisect" event.
+
+    Args:
+      text1: Old string being diffed.
+      text2: New string being diffed.
+      iterations: Number of edit distances d explored.
+      timeout: True if the deadline was reached.
+      start: Time when the bisect started.
+      expensive: True if Diff_BisectCost was reached.
+      vectorized: True if the last steps were walked with NumPy.
+    """
+    self.diff_trace("bisect", length1=len(text1), length2=len(text2),
+                    iterations=iterations, timeout=timeout,
+                    expensive=expensive, vectorized=vectorized,
+                    seconds=time.time() - start)
 
   def diff_bisectSplit(self, text1, text2, x, y, deadline):
     """Given the location of the 'middle snake', split the diff in two parts
@@ -380,6 +1419,233 @@ class diff_match_patch:
 
     return diffs + diffsb
 
+  def diff_algorithm(self, text1, text2):
+    """Choose the algorithm finding the differences following Diff_Algorithm.
+
+    Args:
+      text1: Old string to be diffed.
+      text2: New string to be diffed.
+
+    Returns:
+      "myers" for diff_bisect, "onp" for diff_onp or "bitparallel" for
+      diff_bitParallel.
+    """
+    if self.Diff_Algorithm != "auto":
+      return self.Diff_Algorithm
+    if max(len(text1), len(text2)) <= self.Diff_BitParallelChars:
+      # A few operations on short integers per character, whatever the edits.
+      return "bitparallel"
+    # diff_bisect walks at least half the length difference in steps
+    # widening on both sides, diff_onp walks a band as wide as the length
+    # difference once per deletion, and there are fewer deletions than
+    # characters in the shorter text.
+    if (self.Diff_BisectCost == 0 and
+        abs(len(text1) - len(text2)) > min(len(text1), len(text2))):
+      return "onp"
+    return "myers"
+
+  def diff_bitParallel(self, text1, text2, deadline):
+    """Find the differences between two texts from their longest common
+      subsequence, computed bit-parallel after Allison, Dix and Hyyro: each
+      column of the LCS table is a bit vector over text1, held in an integer
+      and derived from the previous column with a few integer operations.
+      Minimal like diff_bisect, without a Python loop over the diagonals.
+
+    Args:
+      text1: Old string to be diffed.
+      text2: New string to be diffed.
+      deadline: Time at which to bail if not yet complete.
+
+    Returns:
+      Array of diff tuples, or None if the deadline was reached.
+    """
+    start = None
+    if self.Diff_Trace is not None:
+      start = time.time()
+    # Bit i of masks[char] is set where text1[i] is char, built from the
+    # positions of each character rather than one bit at a time.
+    positions = {}
+    for (i, char) in enumerate(text1):
+      positions.setdefault(char, []).append(i)
+    masks = {}
+    for (char, indices) in positions.items():
+      bits = bytearray(len(text1) / 8 + 1)
+      for i in indices:
+        bits[i >> 3] |= 1 << (i & 7)
+      bits.reverse()
+      masks[char] = int(binascii.hexlify(bits), 16)
+    positions = None  # Garbage collect.
+    full = (1 << len(text1)) - 1
+    # Bit i of column j is clear where the LCS of text1[:i + 1] and
+    # text2[:j] is longer than the LCS of text1[:i] and text2[:j].
+    v = full
+    columns = [v]
+    for char in text2:
+      # Bail out if deadline is reached.
+      if time.time() > deadline:
+        if self.Diff_Trace is not None:
+          self.diff_trace("bitParallel", length1=len(text1),
+                          length2=len(text2), timeout=True,
+                          seconds=time.time() - start)
+        return None
+      u = v & masks.get(char, 0)
+      v = ((v + u) | (v - u)) & full
+      columns.append(v)
+
+    # Trace back from the end, as runs of [op, start, end] in text1 for
+    # deletions and equalities, in text2 for insertions.
+    runs = []
+    def diff_bitParallelRun(op, i):
+      if runs and runs[-1][0] == op and runs[-1][1] == i + 1:
+        runs[-1][1] = i
+      else:
+        runs.append([op, i, i + 1])
+    i = len(text1)
+    j = len(text2)
+    while i > 0 and j > 0:
+      if text1[i - 1] == text2[j - 1]:
+        # A common character always extends the LCS.
+        i -= 1
+        j -= 1
+        diff_bitParallelRun(self.DIFF_EQUAL, i)
+      elif columns[j] >> (i - 1) & 1:
+        # The LCS is the same without text1[i - 1].
+        i -= 1
+        diff_bitParallelRun(self.DIFF_DELETE, i)
+      else:
+        j -= 1
+        diff_bitParallelRun(self.DIFF_INSERT, j)
+    columns = None  # Garbage collect.
+    if j > 0:
+      runs.append([self.DIFF_INSERT, 0, j])
+    if i > 0:
+      runs.append([self.DIFF_DELETE, 0, i])
+    runs.reverse()
+    if self.Diff_Trace is not None:
+      self.diff_trace("bitParallel", length1=len(text1), length2=len(text2),
+                      timeout=False, seconds=time.time() - start)
+
+    diffs = []
+    for (op, i, j) in runs:
+      if op == self.DIFF_INSERT:
+        diffs.append((op, text2[i:j]))
+      else:
+        diffs.append((op, text1[i:j]))
+    return diffs
+
+  def diff_onp(self, text1, text2, deadline):
+    """Find the differences between two texts with the O(NP) algorithm of
+      Wu, Manber and Myers, which only walks the diagonals between the start
+      and the end of the edit graph plus one on each side per deletion from
+      the shorter text.  Much faster than diff_bisect when one text is much
+      longer than the other, for the same number of edits.
+
+    Args:
+      text1: Old string to be diffed.
+      text2: New string to be diffed.
+      deadline: Time at which to bail if not yet complete.
+
+    Returns:
+      Array of diff tuples, or None if the deadline was reached.
+    """
+    # Walk from the shorter text a to the longer text b.
+    if len(text1) > len(text2):
+      (a, b) = (text2, text1)
+      (op_a, op_b) = (self.DIFF_INSERT, self.DIFF_DELETE)
+    else:
+      (a, b) = (text1, text2)
+      (op_a, op_b) = (self.DIFF_DELETE, self.DIFF_INSERT)
+    m = len(a)
+    n = len(b)
+    delta = n - m
+    # fp[offset + k] is the furthest y reached on diagonal k = y - x, and
+    # path[offset + k] the node of the snake ending there.
+    offset = m + 1
+    fp = [-1] * (m + n + 3)
+    path = [-1] * (m + n + 3)
+    # Nodes: the end of each snake and the node of the snake before its edit.
+    node_x = array.array("i")
+    node_y = array.array("i")
+    node_prev = array.array("i")
+    start = None
+    if self.Diff_Trace is not None:
+      start = time.time()
+    p = -1
+    while fp[offset + delta] != n:
+      p += 1
+      # Bail out if deadline is reached.
+      if time.time() > deadline:
+        if self.Diff_Trace is not None:
+          self.diff_trace("onp", length1=len(text1), length2=len(text2),
+                          iterations=p, timeout=True,
+                          seconds=time.time() - start)
+        return None
+      # Below delta upwards, above delta downwards, then delta itself.
+      ks = list(xrange(-p, delta)) + list(xrange(delta + p, delta, -1))
+      ks.append(delta)
+      for k in ks:
+        k_offset = offset + k
+        y = fp[k_offset - 1] + 1
+        if y > fp[k_offset + 1]:
+          # Insert from b.
+          prev = path[k_offset - 1]
+        else:
+          # Delete from a.
+          y = fp[k_offset + 1]
+          prev = path[k_offset + 1]
+        x = y - k
+        while x < m and y < n and a[x] == b[y]:
+          x += 1
+          y += 1
+        if y != fp[k_offset]:
+          # Else keep the snake reached with fewer deletions.
+          fp[k_offset] = y
+          path[k_offset] = len(node_x)
+          node_x.append(x)
+          node_y.append(y)
+          node_prev.append(prev)
+    if self.Diff_Trace is not None:
+      self.diff_trace("onp", length1=len(text1), length2=len(text2),
+                      iterations=p + 1, timeout=False,
+                      seconds=time.time() - start)
+
+    nodes = []
+    node = path[offset + delta]
+    while node != -1:
+      nodes.append(node)
+      node = node_prev[node]
+    nodes.reverse()
+
+    # Runs of (op, start, end) in a for deletions and equalities, in b for
+    # insertions.
+    runs = []
+    def diff_onpRun(op, i):
+      if runs and runs[-1][0] == op and runs[-1][2] == i:
+        runs[-1][2] = i + 1
+      else:
+        runs.append([op, i, i + 1])
+    (prev_x, prev_y) = (0, 0)
+    for node in nodes:
+      (x, y) = (node_x[node], node_y[node])
+      if node_prev[node] != -1:
+        if y - x > prev_y - prev_x:
+          diff_onpRun(op_b, prev_y)
+          prev_y += 1
+        else:
+          diff_onpRun(op_a, prev_x)
+          prev_x += 1
+      if x > prev_x:
+        runs.append([self.DIFF_EQUAL, prev_x, x])
+      (prev_x, prev_y) = (x, y)
+
+    diffs = []
+    for (op, i, j) in runs:
+      if op == op_b:
+        diffs.append((op, b[i:j]))
+      else:
+        diffs.append((op, a[i:j]))
+    return diffs
+
   def diff_linesToChars(self, text1, text2):
     """Split two texts into an array of strings.  Reduce the texts to a string
     of hashes where each Unicode character represents one line.
@@ -436,6 +1702,127 @@ class diff_match_patch:
     chars2 = diff_linesToCharsMunge(text2)
     return (chars1, chars2, lineArray)
 
+  def diff_wordsToChars(self, text1, text2):
+    """Split two texts into an array of tokens: runs of word characters, runs
+    of whitespace and runs of punctuation.  Reduce the texts to a string of
+    hashes where each Unicode character represents one token.
+    Use diff_charsToLines to rehydrate the diffs afterwards.
+
+    Args:
+      text1: First string.
+      text2: Second string.
+
+    Returns:
+      Three element tuple, containing the encoded text1, the encoded text2 and
+      the array of unique tokens.  The zeroth element of the array of unique
+      tokens is intentionally blank.
+    """
+    tokenArray = ['']  # e.g. tokenArray[4] == "Hello"
+    tokenHash = {}     # e.g. tokenHash["Hello"] == 4
+
+    def diff_wordsToCharsMunge(text, maxTokens):
+      """Split a text into an array of tokens.  Reduce the text to a string
+      of hashes where each Unicode character represents one token.
+      Modifies tokenArray and tokenHash through being a closure.
+
+      Args:
+        text: String to encode.
+        maxTokens: Maximum length of tokenArray.
+
+      Returns:
+        Encoded string.
+      """
+      chars = []
+      for match in self.WORD_TOKEN_REGEX.finditer(text):
+        token = match.group()
+        if token not in tokenHash and len(tokenArray) == maxTokens:
+          # Out of code points, the rest of the text becomes one token.
+          token = text[match.start():]
+
+        if token in tokenHash:
+          chars.append(unichr(tokenHash[token]))
+        else:
+          tokenArray.append(token)
+          tokenHash[token] = len(tokenArray) - 1
+          chars.append(unichr(len(tokenArray) - 1))
+
+        if len(token) != match.end() - match.start():
+          break
+      return "".join(chars)
+
+    # Allocate 2/3rds of the space for text1, the rest for text2.
+    chars1 = diff_wordsToCharsMunge(text1, 43690)
+    chars2 = diff_wordsToCharsMunge(text2, 65535)
+    return (chars1, chars2, tokenArray)
+
+  def diff_idsToChars(self, ids1, ids2):
+    """Reduce two arrays of ids, from a sequence_encoder, to strings where
+    each Unicode character represents one id.  Only the ids found in both
+    arrays past their common prefix and suffix can match, so they have their
+    own characters, while the others share one character per array, and the
+    common prefix and suffix one each.  The diff functions, which all trim the
+    common prefix and suffix first, compare these strings like the ids.
+    Use diff_charsToItems to rehydrate the diffs afterwards.
+
+    Args:
+      ids1: First array of ids.
+      ids2: Second array of ids.
+
+    Returns:
+      Two element tuple, containing the encoded ids1 and the encoded ids2, or
+      None if there are more common ids than code points (see diff_ids).
+    """
+    # The common prefix and suffix only need to compare equal to each other,
+    # "\x03" and "\x04" stand for their ids and "\x01" and "\x02" for the
+    # ids found in only one of the arrays.  "\x00" is avoided as in
+    # diff_linesToChars.
+    prefixlength = self.diff_commonPrefix(ids1, ids2)
+    suffixlength = min(self.diff_commonSuffix(ids1, ids2),
+                       min(len(ids1), len(ids2)) - prefixlength)
+    middle1 = ids1[prefixlength:len(ids1) - suffixlength]
+    middle2 = ids2[prefixlength:len(ids2) - suffixlength]
+
+    common = set(middle1) & set(middle2)
+    if len(common) + 5 > sys.maxunicode:
+      return None
+    chars = {}
+    for itemId in middle1:
+      if itemId in common and itemId not in chars:
+        chars[itemId] = unichr(len(chars) + 5)
+
+    chars1 = u"".join([u"\x03" * prefixlength] +
+                      [chars.get(itemId, u"\x01") for itemId in middle1] +
+                      [u"\x04" * suffixlength])
+    chars2 = u"".join([u"\x03" * prefixlength] +
+                      [chars.get(itemId, u"\x02") for itemId in middle2] +
+                      [u"\x04" * suffixlength])
+    return (chars1, chars2)
+
+  def diff_charsToItems(self, diffs, ids1, ids2, items):
+    """Rehydrate the text in a diff of the strings of diff_idsToChars, or of
+    the arrays of ids themselves, from the positions of its changes in the
+    arrays of ids.
+
+    Args:
+      diffs: Array of diff tuples.
+      ids1: First array of ids.
+      ids2: Second array of ids.
+      items: Array of the items of the ids.
+    """
+    pointer1 = 0
+    pointer2 = 0
+    for x in xrange(len(diffs)):
+      (op, chars) = diffs[x]
+      if op == self.DIFF_INSERT:
+        ids = ids2[pointer2:pointer2 + len(chars)]
+        pointer2 += len(chars)
+      else:
+        ids = ids1[pointer1:pointer1 + len(chars)]
+        pointer1 += len(chars)
+        if op == self.DIFF_EQUAL:
+          pointer2 += len(chars)
+      diffs[x] = (op, "".join([items[itemId] for itemId in ids]))
+
   def diff_charsToLines(self, diffs, lineArray):
     """Rehydrate the text in a diff from a string of line hashes to real lines
     of text.
@@ -445,10 +1832,8 @@ class diff_match_patch:
       lineArray: Array of unique strings.
     """
     for x in xrange(len(diffs)):
-      text = []
-      for char in diffs[x][1]:
-        text.append(lineArray[ord(char)])
-      diffs[x] = (diffs[x][0], "".join(text))
+      (op, chars) = diffs[x]
+      diffs[x] = (op, "".join([lineArray[ord(char)] for char in chars]))
 
   def diff_commonPrefix(self, text1, text2):
     """Determine the common prefix of two strings.
@@ -570,8 +1955,6 @@ class diff_match_patch:
       (longtext, shorttext) = (text1, text2)
     else:
       (shorttext, longtext) = (text1, text2)
-    if len(longtext) < 4 or len(shorttext) * 2 < len(longtext):
-      return None  # Pointless.
 
     def diff_halfMatchI(longtext, shorttext, i):
       """Does a substring of shorttext exist within longtext such that the
@@ -609,12 +1992,24 @@ class diff_match_patch:
       else:
         return None
 
-    # First check if the second quarter is the seed for a half-match.
-    hm1 = diff_halfMatchI(longtext, shorttext, (len(longtext) + 3) / 4)
-    # Check again based on the third quarter.
-    hm2 = diff_halfMatchI(longtext, shorttext, (len(longtext) + 1) / 2)
+    if len(longtext) < 4 or len(shorttext) * 2 < len(longtext):
+      hm1 = hm2 = None  # Pointless.
+    else:
+      # First check if the second quarter is the seed for a half-match.
+      hm1 = diff_halfMatchI(longtext, shorttext, (len(longtext) + 3) / 4)
+      # Check again based on the third quarter.
+      hm2 = diff_halfMatchI(longtext, shorttext, (len(longtext) + 1) / 2)
     if not hm1 and not hm2:
-      return None
+      # Any half match contains one of the seeds, look for a shorter common
+      # substring.
+      if (self.Diff_HalfMatchChars <= 0 or
+          len(shorttext) < self.Diff_HalfMatchChars):
+        return None
+      (i, j, length) = self.diff_commonSubstring(longtext, shorttext)
+      if length < self.Diff_HalfMatchChars:
+        return None
+      hm = (longtext[:i], longtext[i + length:], shorttext[:j],
+            shorttext[j + length:], shorttext[j:j + length])
     elif not hm2:
       hm = hm1
     elif not hm1:
@@ -633,6 +2028,68 @@ class diff_match_patch:
       (text2_a, text2_b, text1_a, text1_b, mid_common) = hm
     return (text1_a, text1_b, text2_a, text2_b, mid_common)
 
+  def diff_commonSubstring(self, text1, text2):
+    """Find the longest common substring of two texts in linear time, by
+    running text1 through the suffix automaton of text2.
+
+    Args:
+      text1: First string.
+      text2: Second string, preferably the shorter one.
+
+    Returns:
+      Tuple of the start of the first longest common substring in text1, its
+      start in text2 and its length.
+    """
+    # State 0 is the empty string.  Each state stands for the substrings of
+    # text2 ending at the same set of positions, the longest of which is
+    # length[state] long and ends first at end[state].
+    transitions = [{}]
+    link = [-1]
+    length = [0]
+    end = [-1]
+    last = 0
+    for (i, char) in enumerate(text2):
+      state = len(length)
+      transitions.append({})
+      link.append(0)
+      length.append(length[last] + 1)
+      end.append(i)
+      p = last
+      while p != -1 and char not in transitions[p]:
+        transitions[p][char] = state
+        p = link[p]
+      if p != -1:
+        q = transitions[p][char]
+        if length[p] + 1 == length[q]:
+          link[state] = q
+        else:
+          clone = len(length)
+          transitions.append(transitions[q].copy())
+          link.append(link[q])
+          length.append(length[p] + 1)
+          end.append(end[q])
+          while p != -1 and transitions[p].get(char) == q:
+            transitions[p][char] = clone
+            p = link[p]
+          link[q] = clone
+          link[state] = clone
+      last = state
+
+    # Follow text1, keeping the longest suffix of text1[:i + 1] in text2.
+    best = (0, 0, 0)
+    state = 0
+    common = 0
+    for (i, char) in enumerate(text1):
+      while state and char not in transitions[state]:
+        state = link[state]
+        common = length[state]
+      if char in transitions[state]:
+        state = transitions[state][char]
+        common += 1
+        if common > best[2]:
+          best = (i + 1 - common, end[state] + 1 - common, common)
+    return best
+
   def diff_cleanupSemantic(self, diffs):
     """Reduce the number of edits by eliminating semantically trivial
     equalities.
@@ -640,73 +2097,77 @@ class diff_match_patch:
     Args:
       diffs: Array of diff tuples.
     """
-    changes = False
-    equalities = []  # Stack of indices where equalities are found.
-    lastequality = None  # Always equal to equalities[-1][1]
-    pointer = 0  # Index of current position.
-    # Number of chars that changed prior to the equality.
-    length_insertions1, length_deletions1 = 0, 0
-    # Number of chars that changed after the equality.
+    # One pass rebuilding the diff.  An eliminated equality turns into edits,
+    # so the previous one is reevaluated on the spot against every change
+    # since it, instead of rescanning the diff from there.
+    result = []
+    eliminated = set()  # Indices in result of the eliminated equalities.
+    # Stack of the equalities found, with the number of chars that changed
+    # prior to each: (index, text, length_insertions1, length_deletions1).
+    equalities = []
+    # Number of chars that changed after the last equality.
     length_insertions2, length_deletions2 = 0, 0
-    while pointer < len(diffs):
-      if diffs[pointer][0] == self.DIFF_EQUAL:  # Equality found.
-        equalities.append(pointer)
-        length_insertions1, length_insertions2 = length_insertions2, 0
-        length_deletions1, length_deletions2 = length_deletions2, 0
-        lastequality = diffs[pointer][1]
+    for (op, text) in diffs:
+      if op == self.DIFF_EQUAL:  # Equality found.
+        equalities.append((len(result), text,
+                           length_insertions2, length_deletions2))
+        length_insertions2, length_deletions2 = 0, 0
       else:  # An insertion or deletion.
-        if diffs[pointer][0] == self.DIFF_INSERT:
-          length_insertions2 += len(diffs[pointer][1])
+        if op == self.DIFF_INSERT:
+          length_insertions2 += len(text)
         else:
-          length_deletions2 += len(diffs[pointer][1])
-        if (lastequality != None and (len(lastequality) <=
-            max(length_insertions1, length_deletions1)) and
-            (len(lastequality) <= max(length_insertions2, length_deletions2))):
-          # Duplicate record.
-          diffs.insert(equalities[-1], (self.DIFF_DELETE, lastequality))
-          # Change second copy to insert.
-          diffs[equalities[-1] + 1] = (self.DIFF_INSERT,
-              diffs[equalities[-1] + 1][1])
-          # Throw away the equality we just deleted.
+          length_deletions2 += len(text)
+        while equalities:
+          (index, lastequality, length_insertions1,
+           length_deletions1) = equalities[-1]
+          if not ((len(lastequality) <=
+                   max(length_insertions1, length_deletions1)) and
+                  (len(lastequality) <=
+                   max(length_insertions2, length_deletions2))):
+            break
+          # Turn the equality into a deletion and an insertion.
+          eliminated.add(index)
           equalities.pop()
-          # Throw away the previous equality (it needs to be reevaluated).
-          if len(equalities):
-            equalities.pop()
-          if len(equalities):
-            pointer = equalities[-1]
-          else:
-            pointer = -1
-          # Reset the counters.
-          length_insertions1, length_deletions1 = 0, 0
-          length_insertions2, length_deletions2 = 0, 0
-          lastequality = None
-          changes = True
-      pointer += 1
+          # The previous equality (if any) is followed by all of it now.
+          length_insertions2 += length_insertions1 + len(lastequality)
+          length_deletions2 += length_deletions1 + len(lastequality)
+      result.append((op, text))
 
     # Normalize the diff.
-    if changes:
+    if eliminated:
+      diffs[:] = []
+      for (index, (op, text)) in enumerate(result):
+        if index in eliminated:
+          diffs.append((self.DIFF_DELETE, text))
+          diffs.append((self.DIFF_INSERT, text))
+        else:
+          diffs.append((op, text))
       self.diff_cleanupMerge(diffs)
     self.diff_cleanupSemanticLossless(diffs)
 
     # Find any overlaps between deletions and insertions.
     # e.g: <del>abcxx</del><ins>xxdef</ins>
     #   -> <del>abc</del>xx<ins>def</ins>
-    pointer = 1
-    while pointer < len(diffs):
-      if (diffs[pointer - 1][0] == self.DIFF_DELETE and
-          diffs[pointer][0] == self.DIFF_INSERT):
-        deletion = diffs[pointer - 1][1]
-        insertion = diffs[pointer][1]
-        overlap_length = self.diff_commonOverlap(deletion, insertion)
+    result = []
+    for (op, text) in diffs:
+      if (op == self.DIFF_INSERT and result and
+          result[-1][0] == self.DIFF_DELETE):
+        deletion = result[-1][1]
+        overlap_length = self.diff_commonOverlap(deletion, text)
         if overlap_length != 0:
           # Overlap found.  Insert an equality and trim the surrounding edits.
-          diffs.insert(pointer, (self.DIFF_EQUAL, insertion[:overlap_length]))
-          diffs[pointer - 1] = (self.DIFF_DELETE,
-                                deletion[:len(deletion) - overlap_length])
-          diffs[pointer + 1] = (self.DIFF_INSERT, insertion[overlap_length:])
-          pointer += 1
-        pointer += 1
-      pointer += 1
+          result[-1] = (self.DIFF_DELETE,
+                        deletion[:len(deletion) - overlap_length])
+          result.append((self.DIFF_EQUAL, text[:overlap_length]))
+          text = text[overlap_length:]
+      result.append((op, text))
+    diffs[:] = result
+
+  # Boundary classes of ASCII characters for diff_cleanupSemanticLossless:
+  # 0 alphanumeric, 1 punctuation, 2 whitespace, 3 line break.
+  SEMANTIC_CLASSES = dict([(chr(c), (not chr(c).isalnum()) +
+                            chr(c).isspace() + (chr(c) in "\r\n"))
+                           for c in range(128)])
 
   def diff_cleanupSemanticLossless(self, diffs):
     """Look for single edits surrounded on both sides by equalities
@@ -716,21 +2177,38 @@ class diff_match_patch:
     Args:
       diffs: Array of diff tuples.
     """
+    classes = self.SEMANTIC_CLASSES
 
-    def diff_cleanupSemanticScore(one, two):
-      """Given two strings, compute a score representing whether the
-      internal boundary falls on logical boundaries.
-      Scores range from 5 (best) to 0 (worst).
+    def diff_cleanupSemanticClass(char):
+      """Boundary class of a character, see SEMANTIC_CLASSES.
       Closure, but does not reference any external variables.
 
       Args:
-        one: First string.
-        two: Second string.
+        char: The character.
+
+      Returns:
+        The class.
+      """
+      if char in classes:
+        return classes[char]
+      return (not char.isalnum()) + char.isspace()
+
+    def diff_cleanupSemanticScore(text, start, middle, end):
+      """Given two adjacent slices of a string, compute a score representing
+      whether the internal boundary falls on logical boundaries.
+      Scores range from 5 (best) to 0 (worst).
+      Closure, but only references the class table.
+
+      Args:
+        text: The string.
+        start: Start of the first slice.
+        middle: End of the first slice and start of the second one.
+        end: End of the second slice.
 
       Returns:
         The score.
       """
-      if not one or not two:
+      if start == middle or middle == end:
         # Edges are the best.
         return 5
 
@@ -739,74 +2217,85 @@ class diff_match_patch:
       # 'whitespace'.  Since this function's purpose is largely cosmetic,
       # the choice has been made to use each language's native features
       # rather than force total conformity.
-      score = 0
-      # One point for non-alphanumeric.
-      if not one[-1].isalnum() or not two[0].isalnum():
-        score += 1
-        # Two points for whitespace.
-        if one[-1].isspace() or two[0].isspace():
+      # One point for non-alphanumeric, two points for whitespace, three
+      # points for line breaks.
+      score = max(diff_cleanupSemanticClass(text[middle - 1]),
+                  diff_cleanupSemanticClass(text[middle]))
+      if score == 3:
+        # Four points for blank lines.
+        if (text.endswith("\n\n", start, middle) or
+            text.endswith("\n\r\n", start, middle) or
+            text.startswith("\n\n", middle, end) or
+            text.startswith("\r\n\n", middle, end) or
+            text.startswith("\n\r\n", middle, end) or
+            text.startswith("\r\n\r\n", middle, end)):
           score += 1
-          # Three points for line breaks.
-          if (one[-1] == "\r" or one[-1] == "\n" or
-              two[0] == "\r" or two[0] == "\n"):
-            score += 1
-            # Four points for blank lines.
-            if (re.search("\\n\\r?\\n$", one) or
-                re.match("^\\r?\\n\\r?\\n", two)):
-              score += 1
       return score
 
-    pointer = 1
+    # One pass rebuilding the diff: result holds the diffs before the
+    # current one and rest the current one and those after it, reversed.
+    result = []
+    rest = diffs[::-1]
+    if rest:
+      result.append(rest.pop())
     # Intentionally ignore the first and last element (don't need checking).
-    while pointer < len(diffs) - 1:
-      if (diffs[pointer - 1][0] == self.DIFF_EQUAL and
-          diffs[pointer + 1][0] == self.DIFF_EQUAL):
+    while len(rest) > 1:
+      if (result[-1][0] == self.DIFF_EQUAL and
+          rest[-2][0] == self.DIFF_EQUAL):
         # This is a single edit surrounded by equalities.
-        equality1 = diffs[pointer - 1][1]
-        edit = diffs[pointer][1]
-        equality2 = diffs[pointer + 1][1]
+        equality1 = result[-1][1]
+        edit = rest[-1][1]
+        equality2 = rest[-2][1]
 
         # First, shift the edit as far left as possible.
-        commonOffset = self.diff_commonSuffix(equality1, edit)
-        if commonOffset:
-          commonString = edit[-commonOffset:]
-          equality1 = equality1[:-commonOffset]
-          edit = commonString + edit[:-commonOffset]
-          equality2 = commonString + equality2
+        pointer = len(equality1) - self.diff_commonSuffix(equality1, edit)
+        if (pointer == len(equality1) and
+            not (edit and equality2 and edit[0] == equality2[0])):
+          # It can not move at all.
+          result.append(rest.pop())
+          continue
+
+        # The edit is text[pointer:pointer + length], shifting it moves the
+        # pointer without copying the equalities around.
+        text = equality1 + edit + equality2
+        length = len(edit)
 
         # Second, step character by character right, looking for the best fit.
-        bestEquality1 = equality1
-        bestEdit = edit
-        bestEquality2 = equality2
-        bestScore = (diff_cleanupSemanticScore(equality1, edit) +
-            diff_cleanupSemanticScore(edit, equality2))
-        while edit and equality2 and edit[0] == equality2[0]:
-          equality1 += edit[0]
-          edit = edit[1:] + equality2[0]
-          equality2 = equality2[1:]
-          score = (diff_cleanupSemanticScore(equality1, edit) +
-              diff_cleanupSemanticScore(edit, equality2))
+        bestPointer = pointer
+        bestScore = (diff_cleanupSemanticScore(text, 0, pointer,
+                                               pointer + length) +
+            diff_cleanupSemanticScore(text, pointer, pointer + length,
+                                      len(text)))
+        while (length and pointer + length < len(text) and
+               text[pointer] == text[pointer + length]):
+          pointer += 1
+          score = (diff_cleanupSemanticScore(text, 0, pointer,
+                                             pointer + length) +
+              diff_cleanupSemanticScore(text, pointer, pointer + length,
+                                        len(text)))
           # The >= encourages trailing rather than leading whitespace on edits.
           if score >= bestScore:
             bestScore = score
-            bestEquality1 = equality1
-            bestEdit = edit
-            bestEquality2 = equality2
+            bestPointer = pointer
 
-        if diffs[pointer - 1][1] != bestEquality1:
+        if bestPointer != len(equality1):
           # We have an improvement, save it back to the diff.
-          if bestEquality1:
-            diffs[pointer - 1] = (diffs[pointer - 1][0], bestEquality1)
-          else:
-            del diffs[pointer - 1]
-            pointer -= 1
-          diffs[pointer] = (diffs[pointer][0], bestEdit)
-          if bestEquality2:
-            diffs[pointer + 1] = (diffs[pointer + 1][0], bestEquality2)
+          op = rest.pop()[0]
+          rest.pop()
+          result.pop()
+          bestEdit = (op, text[bestPointer:bestPointer + length])
+          if bestPointer + length < len(text):
+            rest.append((self.DIFF_EQUAL, text[bestPointer + length:]))
+          if bestPointer:
+            result.append((self.DIFF_EQUAL, text[:bestPointer]))
+          if bestPointer + length < len(text):
+            result.append(bestEdit)
           else:
-            del diffs[pointer + 1]
-            pointer -= 1
-      pointer += 1
+            rest.append(bestEdit)
+          continue
+      result.append(rest.pop())
+    result.extend(rest[::-1])
+    diffs[:] = result
 
   def diff_cleanupEfficiency(self, diffs):
     """Reduce the number of edits by eliminating operationally trivial
@@ -815,31 +2304,31 @@ class diff_match_patch:
     Args:
       diffs: Array of diff tuples.
     """
-    changes = False
-    equalities = []  # Stack of indices where equalities are found.
-    lastequality = ''  # Always equal to equalities[-1][1]
-    pointer = 0  # Index of current position.
-    pre_ins = False  # Is there an insertion operation before the last equality.
-    pre_del = False  # Is there a deletion operation before the last equality.
+    # One pass rebuilding the diff, like diff_cleanupSemantic.
+    result = []
+    eliminated = set()  # Indices in result of the eliminated equalities.
+    # Stack of the candidate equalities found, with the operations before
+    # each: (index, text, pre_ins, pre_del).
+    equalities = []
+    # Candidates set aside by an elimination which could not affect them.
+    # They are back on the stack if it runs empty, as a rescan of the diff
+    # from its start would find them again.
+    hidden = []
     post_ins = False  # Is there an insertion operation after the last equality.
     post_del = False  # Is there a deletion operation after the last equality.
-    while pointer < len(diffs):
-      if diffs[pointer][0] == self.DIFF_EQUAL:  # Equality found.
-        if (len(diffs[pointer][1]) < self.Diff_EditCost and
-            (post_ins or post_del)):
+    for (op, text) in diffs:
+      if op == self.DIFF_EQUAL:  # Equality found.
+        if len(text) < self.Diff_EditCost and (post_ins or post_del):
           # Candidate found.
-          equalities.append(pointer)
-          pre_ins = post_ins
-          pre_del = post_del
-          lastequality = diffs[pointer][1]
+          equalities.append((len(result), text, post_ins, post_del))
         else:
           # Not a candidate, and can never become one.
           equalities = []
-          lastequality = ''
+          hidden = []
 
         post_ins = post_del = False
       else:  # An insertion or deletion.
-        if diffs[pointer][0] == self.DIFF_DELETE:
+        if op == self.DIFF_DELETE:
           post_del = True
         else:
           post_ins = True
@@ -851,32 +2340,35 @@ class diff_match_patch:
         # <ins>A</del>X<ins>C</ins><del>D</del>
         # <ins>A</ins><del>B</del>X<del>C</del>
 
-        if lastequality and ((pre_ins and pre_del and post_ins and post_del) or
-                             ((len(lastequality) < self.Diff_EditCost / 2) and
-                              (pre_ins + pre_del + post_ins + post_del) == 3)):
-          # Duplicate record.
-          diffs.insert(equalities[-1], (self.DIFF_DELETE, lastequality))
-          # Change second copy to insert.
-          diffs[equalities[-1] + 1] = (self.DIFF_INSERT,
-              diffs[equalities[-1] + 1][1])
+        while equalities:
+          (index, lastequality, pre_ins, pre_del) = equalities[-1]
+          if not (lastequality and
+                  ((pre_ins and pre_del and post_ins and post_del) or
+                   ((len(lastequality) < self.Diff_EditCost / 2) and
+                    (pre_ins + pre_del + post_ins + post_del) == 3))):
+            break
+          # Turn the equality into a deletion and an insertion.
+          eliminated.add(index)
           equalities.pop()  # Throw away the equality we just deleted.
-          lastequality = ''
+          post_ins = post_del = True
           if pre_ins and pre_del:
             # No changes made which could affect previous entry, keep going.
-            post_ins = post_del = True
+            hidden += equalities
             equalities = []
-          else:
-            if len(equalities):
-              equalities.pop()  # Throw away the previous equality.
-            if len(equalities):
-              pointer = equalities[-1]
-            else:
-              pointer = -1
-            post_ins = post_del = False
-          changes = True
-      pointer += 1
-
-    if changes:
+          elif len(equalities) < 2:
+            # Reevaluate the previous equality, with the ones set aside.
+            equalities = hidden + equalities
+            hidden = []
+      result.append((op, text))
+
+    if eliminated:
+      diffs[:] = []
+      for (index, (op, text)) in enumerate(result):
+        if index in eliminated:
+          diffs.append((self.DIFF_DELETE, text))
+          diffs.append((self.DIFF_INSERT, text))
+        else:
+          diffs.append((op, text))
       self.diff_cleanupMerge(diffs)
 
   def diff_cleanupMerge(self, diffs):
@@ -886,105 +2378,95 @@ class diff_match_patch:
     Args:
       diffs: Array of diff tuples.
     """
+    # One pass rebuilding the diff.
+    result = []
+    equality = None  # Text of the last equality.
+    edits = []  # Edits since the last equality.
     diffs.append((self.DIFF_EQUAL, ''))  # Add a dummy entry at the end.
-    pointer = 0
-    count_delete = 0
-    count_insert = 0
-    text_delete = ''
-    text_insert = ''
-    while pointer < len(diffs):
-      if diffs[pointer][0] == self.DIFF_INSERT:
-        count_insert += 1
-        text_insert += diffs[pointer][1]
-        pointer += 1
-      elif diffs[pointer][0] == self.DIFF_DELETE:
-        count_delete += 1
-        text_delete += diffs[pointer][1]
-        pointer += 1
-      elif diffs[pointer][0] == self.DIFF_EQUAL:
-        # Upon reaching an equality, check for prior redundancies.
-        if count_delete + count_insert > 1:
-          if count_delete != 0 and count_insert != 0:
-            # Factor out any common prefixies.
-            commonlength = self.diff_commonPrefix(text_insert, text_delete)
-            if commonlength != 0:
-              x = pointer - count_delete - count_insert - 1
-              if x >= 0 and diffs[x][0] == self.DIFF_EQUAL:
-                diffs[x] = (diffs[x][0], diffs[x][1] +
-                            text_insert[:commonlength])
-              else:
-                diffs.insert(0, (self.DIFF_EQUAL, text_insert[:commonlength]))
-                pointer += 1
-              text_insert = text_insert[commonlength:]
-              text_delete = text_delete[commonlength:]
-            # Factor out any common suffixies.
-            commonlength = self.diff_commonSuffix(text_insert, text_delete)
-            if commonlength != 0:
-              diffs[pointer] = (diffs[pointer][0], text_insert[-commonlength:] +
-                  diffs[pointer][1])
-              text_insert = text_insert[:-commonlength]
-              text_delete = text_delete[:-commonlength]
-          # Delete the offending records and add the merged ones.
-          if count_delete == 0:
-            diffs[pointer - count_insert : pointer] = [
-                (self.DIFF_INSERT, text_insert)]
-          elif count_insert == 0:
-            diffs[pointer - count_delete : pointer] = [
-                (self.DIFF_DELETE, text_delete)]
-          else:
-            diffs[pointer - count_delete - count_insert : pointer] = [
-                (self.DIFF_DELETE, text_delete),
-                (self.DIFF_INSERT, text_insert)]
-          pointer = pointer - count_delete - count_insert + 1
-          if count_delete != 0:
-            pointer += 1
-          if count_insert != 0:
-            pointer += 1
-        elif pointer != 0 and diffs[pointer - 1][0] == self.DIFF_EQUAL:
-          # Merge this equality with the previous one.
-          diffs[pointer - 1] = (diffs[pointer - 1][0],
-                                diffs[pointer - 1][1] + diffs[pointer][1])
-          del diffs[pointer]
-        else:
-          pointer += 1
-
-        count_insert = 0
-        count_delete = 0
-        text_delete = ''
-        text_insert = ''
+    for diff in diffs:
+      if diff[0] != self.DIFF_EQUAL:
+        edits.append(diff)
+        continue
+      # Upon reaching an equality, check for prior redundancies.
+      text = diff[1]
+      if len(edits) > 1:
+        texts_delete = [x[1] for x in edits if x[0] == self.DIFF_DELETE]
+        texts_insert = [x[1] for x in edits if x[0] == self.DIFF_INSERT]
+        text_delete = ''.join(texts_delete)
+        text_insert = ''.join(texts_insert)
+        if texts_delete and texts_insert:
+          # Factor out any common prefixies.
+          commonlength = self.diff_commonPrefix(text_insert, text_delete)
+          if commonlength != 0:
+            if equality == None:
+              equality = ''
+            equality += text_insert[:commonlength]
+            text_insert = text_insert[commonlength:]
+            text_delete = text_delete[commonlength:]
+          # Factor out any common suffixies.
+          commonlength = self.diff_commonSuffix(text_insert, text_delete)
+          if commonlength != 0:
+            text = text_insert[-commonlength:] + text
+            text_insert = text_insert[:-commonlength]
+            text_delete = text_delete[:-commonlength]
+        # Add the merged records instead of the offending ones.
+        if equality != None:
+          result.append((self.DIFF_EQUAL, equality))
+        if texts_delete:
+          result.append((self.DIFF_DELETE, text_delete))
+        if texts_insert:
+          result.append((self.DIFF_INSERT, text_insert))
+        equality = text
+        edits = []
+      elif edits:
+        if equality != None:
+          result.append((self.DIFF_EQUAL, equality))
+        result.append(edits[0])
+        equality = text
+        edits = []
+      elif equality != None:
+        # Merge this equality with the previous one.
+        equality += text
+      else:
+        equality = text
 
-    if diffs[-1][1] == '':
-      diffs.pop()  # Remove the dummy entry at the end.
+    if equality != '':  # Remove the dummy entry at the end if still empty.
+      result.append((self.DIFF_EQUAL, equality))
 
     # Second pass: look for single edits surrounded on both sides by equalities
     # which can be shifted sideways to eliminate an equality.
     # e.g: A<ins>BA</ins>C -> <ins>AB</ins>AC
+    # The diffs before the current one are in diffs, the current one and those
+    # after it in result, reversed.
     changes = False
-    pointer = 1
+    result.reverse()
+    diffs[:] = []
+    if result:
+      diffs.append(result.pop())
     # Intentionally ignore the first and last element (don't need checking).
-    while pointer < len(diffs) - 1:
-      if (diffs[pointer - 1][0] == self.DIFF_EQUAL and
-          diffs[pointer + 1][0] == self.DIFF_EQUAL):
+    while len(result) > 1:
+      if (diffs[-1][0] == self.DIFF_EQUAL and
+          result[-2][0] == self.DIFF_EQUAL):
         # This is a single edit surrounded by equalities.
-        if diffs[pointer][1].endswith(diffs[pointer - 1][1]):
+        (op, edit) = result[-1]
+        previous = diffs[-1][1]
+        following = result[-2][1]
+        if edit.endswith(previous):
           # Shift the edit over the previous equality.
-          diffs[pointer] = (diffs[pointer][0],
-              diffs[pointer - 1][1] +
-              diffs[pointer][1][:-len(diffs[pointer - 1][1])])
-          diffs[pointer + 1] = (diffs[pointer + 1][0],
-                                diffs[pointer - 1][1] + diffs[pointer + 1][1])
-          del diffs[pointer - 1]
+          diffs[-1] = (op, previous + edit[:-len(previous)])
+          diffs.append((self.DIFF_EQUAL, previous + following))
+          del result[-2:]
           changes = True
-        elif diffs[pointer][1].startswith(diffs[pointer + 1][1]):
+          continue
+        elif edit.startswith(following):
           # Shift the edit over the next equality.
-          diffs[pointer - 1] = (diffs[pointer - 1][0],
-                                diffs[pointer - 1][1] + diffs[pointer + 1][1])
-          diffs[pointer] = (diffs[pointer][0],
-              diffs[pointer][1][len(diffs[pointer + 1][1]):] +
-              diffs[pointer + 1][1])
-          del diffs[pointer + 1]
+          diffs[-1] = (self.DIFF_EQUAL, previous + following)
+          diffs.append((op, edit[len(following):] + following))
+          del result[-2:]
           changes = True
-      pointer += 1
+          continue
+      diffs.append(result.pop())
+    diffs.extend(result[::-1])
 
     # If shifts were made, the diff needs reordering and another shift sweep.
     if changes:
@@ -1022,6 +2504,46 @@ class diff_match_patch:
     # Add the remaining len(character).
     return last_chars2 + (loc - last_chars1)
 
+  def diff_toOpcodes(self, diffs):
+    """Convert a diff into opcodes telling how to turn text1 into text2 by
+    indexes, like difflib.SequenceMatcher.get_opcodes.
+
+    Args:
+      diffs: Array of diff tuples.
+
+    Returns:
+      Array of (tag, i1, i2, j1, j2) tuples, where text1[i1:i2] is equal to,
+      deleted from, inserted as or replaced by text2[j1:j2] as tag is
+      "equal", "delete", "insert" or "replace".
+    """
+    opcodes = []
+    index1 = 0
+    index2 = 0
+    for (op, data) in diffs:
+      if op == self.DIFF_EQUAL:
+        opcodes.append(("equal", index1, index1 + len(data),
+                        index2, index2 + len(data)))
+        index1 += len(data)
+        index2 += len(data)
+        continue
+
+      (start1, start2) = (index1, index2)
+      if opcodes and opcodes[-1][0] != "equal":
+        # Merge with the previous change.
+        (tag, start1, end1, start2, end2) = opcodes.pop()
+      if op == self.DIFF_DELETE:
+        index1 += len(data)
+      else:
+        index2 += len(data)
+      if start1 == index1:
+        tag = "insert"
+      elif start2 == index2:
+        tag = "delete"
+      else:
+        tag = "replace"
+      opcodes.append((tag, start1, index1, start2, index2))
+    return opcodes
+
   def diff_prettyHtml(self, diffs):
     """Convert a diff array into a pretty HTML report.
 
@@ -1119,7 +2641,7 @@ class diff_match_patch:
       if op == self.DIFF_INSERT:
         # High ascii will raise UnicodeDecodeError.  Use Unicode instead.
         data = data.encode("utf-8")
-        text.append("+" + urllib.quote(data, "!~*'();/?:@&=+$,# "))
+        text.append("+" + quote(data, "!~*'();/?:@&=+$,# "))
       elif op == self.DIFF_DELETE:
         text.append("-%d" % len(data))
       elif op == self.DIFF_EQUAL:
@@ -1140,7 +2662,7 @@ class diff_match_patch:
     Raises:
       ValueError: If invalid input.
     """
-    if type(delta) == unicode:
+    if type(delta) != str:
       # Deltas should be composed of a subset of ascii chars, Unicode not
       # required.  If this encode raises UnicodeEncodeError, delta is invalid.
       delta = delta.encode("ascii")
@@ -1155,7 +2677,7 @@ class diff_match_patch:
       # operation of this token (delete, insert, equality).
       param = token[1:]
       if token[0] == "+":
-        param = urllib.unquote(param).decode("utf-8")
+        param = unquote(param).decode("utf-8")
         diffs.append((self.DIFF_INSERT, param))
       elif token[0] == "-" or token[0] == "=":
         try:
@@ -1772,7 +3294,7 @@ class diff_match_patch:
     Raises:
       ValueError: If invalid input.
     """
-    if type(textline) == unicode:
+    if type(textline) != str:
       # Patches should be composed of a subset of ascii chars, Unicode not
       # required.  If this encode raises UnicodeEncodeError, patch is invalid.
       textline = textline.encode("ascii")
@@ -1813,7 +3335,7 @@ class diff_match_patch:
           sign = text[0][0]
         else:
           sign = ''
-        line = urllib.unquote(text[0][1:])
+        line = unquote(text[0][1:])
         line = line.decode("utf-8")
         if sign == '+':
           # Insertion.
@@ -1881,5 +3403,117 @@ class patch_obj:
         text.append(" ")
       # High ascii will raise UnicodeDecodeError.  Use Unicode instead.
       data = data.encode("utf-8")
-      text.append(urllib.quote(data, "!~*'();/?:@&=+$,# ") + "\n")
+      text.append(quote(data, "!~*'();/?:@&=+$,# ") + "\n")
     return "".join(text)
+
+
+class sequence_encoder:
+  """Class mapping lines or tokens to integer ids, without limit on their
+  number.  Can be shared by the diffs of several texts, so that the items
+  they have in common are hashed once.
+  """
+
+  def __init__(self):
+    """Initializes with no items.
+    """
+    # The zeroth item is intentionally blank, as in diff_linesToChars.
+    self.items = ['']  # e.g. items[4] == "Hello\n"
+    self.ids = {}      # e.g. ids["Hello\n"] == 4
+
+  def encode(self, items):
+    """Map items to their ids, assigning new ids to the unknown ones.
+
+    Args:
+      items: Iterable of strings.
+
+    Returns:
+      Array of ids.
+    """
+    ids = array.array("l")
+    for item in items:
+      itemId = self.ids.get(item)
+      if itemId == None:
+        itemId = len(self.items)
+        self.items.append(item)
+        self.ids[item] = itemId
+      ids.append(itemId)
+    return ids
+
+  def encode_lines(self, text):
+    """Map the lines of a text, with their line breaks, to their ids.
+
+    Args:
+      text: String to encode.
+
+    Returns:
+      Array of ids.
+    """
+    def lines():
+      lineStart = 0
+      lineEnd = -1
+      while lineEnd < len(text) - 1:
+        lineEnd = text.find('\n', lineStart)
+        if lineEnd == -1:
+          lineEnd = len(text) - 1
+        yield text[lineStart:lineEnd + 1]
+        lineStart = lineEnd + 1
+    return self.encode(lines())
+
+  def decode(self, ids):
+    """Join the items of ids back into a string.
+
+    Args:
+      ids: Array of ids.
+
+    Returns:
+      String.
+    """
+    return "".join([self.items[itemId] for itemId in ids])
+
+
+def diff_rediffBlock(block):
+  """Diff a replacement block of diff_lineMode character by character.
+  A function rather than a method, so that Diff_Map may send it to other
+  processes.
+
+  Args:
+    block: Tuple of the diff_match_patch object, the deleted text, the
+      inserted text and the deadline.
+
+  Returns:
+    Array of changes.
+  """
+  (dmp, text1, text2, deadline) = block
+  return dmp.diff_main(text1, text2, False, deadline)
+
+
+def diff_lineIdsBlock(block):
+  """Diff a pair of segments of diff_parallelIds.
+  A function rather than a method, so that Diff_Map may send it to other
+  processes.
+
+  Args:
+    block: Tuple of the diff_match_patch object, the old array of ids, the
+      new array of ids and the deadline.
+
+  Returns:
+    Array of changes.
+  """
+  (dmp, ids1, ids2, deadline) = block
+  return dmp.diff_lineIds(ids1, ids2, deadline)
+
+
+def diff_mainBlock(block):
+  """Diff a pair of segments of diff_parallel.
+  A function rather than a method, so that Diff_Map may send it to other
+  processes.
+
+  Args:
+    block: Tuple of the diff_match_patch object, the old text, the new text,
+      the checklines flag and the deadline.
+
+  Returns:
+    Array of changes.
+  """
+  (dmp, text1, text2, checklines, deadline) = block
+  return dmp.diff_main(text1, text2, checklines, deadline)
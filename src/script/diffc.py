@@ -1,4 +1,4 @@
-#!/usr/bin/python2.4
+#!/usr/bin/python2.7
 
 """ diffc
  http://code.google.com/p/diffc/
@@ -29,8 +29,30 @@ import re
 import os
 import subprocess
 import signal
-
-from diff_match_patch import diff_match_patch
+import time
+import collections
+import hashlib
+import codecs
+import heapq
+import json
+import random
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from diff_match_patch import diff_match_patch, sequence_encoder
 
 class Color:
     "Color definition based on ANSI standard terminal attributes"
@@ -49,6 +71,359 @@ class Color:
     # Default
     DEFAULT = "\x1b[0m"
 
+class WordDiffCache:
+    """LRU cache of the word diffs keyed by the digest of the hunk texts
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        # digest -> (diffs, size), the least recently used first
+        self.entries = collections.OrderedDict()
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, left_str, right_str, settings):
+        h = hashlib.sha1()
+        for s in (repr(settings), left_str, right_str):
+            if not isinstance(s, bytes):
+                # the undecodable input bytes are kept as lone surrogates
+                s = s.encode("utf-8", "surrogatepass")
+            h.update(str(len(s)).encode("ascii") + b":" + s)
+
+        return h.digest()
+
+    def get(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.entries[key] = entry
+        self.hits += 1
+
+        return entry[0]
+
+    def put(self, key, diffs):
+        # rough memory usage: the texts and a tuple per diff
+        size = 64 * len(diffs)
+        for (op, data) in diffs:
+            size += len(data)
+
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+
+        self.entries[key] = (diffs, size)
+        self.size += size
+
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            (k, (d, s)) = self.entries.popitem(False)
+            self.size -= s
+
+class FileWordDiffCache:
+    """Word diff cache stored in a sqlite database shared by the diffc
+    processes.  Only the operations and the lengths of the diffs are stored,
+    the texts being taken from the hunk on lookup.
+    """
+
+    P_ENCODED_DIFF = re.compile("([=+-])(\\d+)")
+
+    # Number of entries written to the database at once
+    WRITE_BATCH = 256
+
+    # One close in EVICT_SAMPLE checks the limits of the database, as well
+    # as the closes after writing more than max_bytes / EVICT_SAMPLE bytes
+    EVICT_SAMPLE = 16
+
+    def __init__(self, path, max_bytes, max_days):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_days = max_days
+
+        self.db = None
+        self.pending = []
+        self.touched = []
+        self.written = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def open(self):
+        if self.db is None and sqlite3 is not None:
+            self.db = sqlite3.connect(self.path, timeout=10)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS word_diff ("
+                            "key BLOB PRIMARY KEY, diffs TEXT, "
+                            "size INTEGER, atime INTEGER)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS word_diff_atime "
+                            "ON word_diff (atime)")
+            self.db.commit()
+
+        return self.db
+
+    def disable(self):
+        """Stops using the database after an error, which is not fatal for
+        coloring the diff
+        """
+        if self.db is not None:
+            try:
+                self.db.close()
+            except sqlite3.Error:
+                pass
+
+        self.path = None
+        self.db = None
+        self.pending = []
+        self.touched = []
+
+    def encode(self, diffs):
+        encoded = []
+        for (op, data) in diffs:
+            encoded.append("-=+"[op + 1] + str(len(data)))
+
+        return "".join(encoded)
+
+    def decode(self, encoded, left_str, right_str):
+        diffs = []
+        i = 0
+        j = 0
+        for (op, length) in self.P_ENCODED_DIFF.findall(encoded):
+            length = int(length)
+            if op == "=":
+                diffs.append((diff_match_patch.DIFF_EQUAL, left_str[i:i + length]))
+                i += length
+                j += length
+            elif op == "-":
+                diffs.append((diff_match_patch.DIFF_DELETE, left_str[i:i + length]))
+                i += length
+            else:
+                diffs.append((diff_match_patch.DIFF_INSERT, right_str[j:j + length]))
+                j += length
+
+        # a collision or a broken entry
+        if i != len(left_str) or j != len(right_str):
+            return None
+
+        return diffs
+
+    def get(self, key, left_str, right_str):
+        if self.path is None:
+            return None
+
+        try:
+            row = self.open().execute("SELECT diffs FROM word_diff WHERE key = ?",
+                                      (sqlite3.Binary(key),)).fetchone()
+        except sqlite3.Error:
+            self.disable()
+            return None
+
+        diffs = None
+        if row is not None:
+            diffs = self.decode(row[0], left_str, right_str)
+
+        if diffs is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.touched.append(key)
+
+        return diffs
+
+    def put(self, key, diffs):
+        if self.path is None:
+            return
+
+        encoded = self.encode(diffs)
+        size = len(key) + len(encoded)
+        self.pending.append((sqlite3.Binary(key), encoded, size))
+        self.written += size
+
+        if len(self.pending) >= self.WRITE_BATCH:
+            self.flush()
+
+    def flush(self):
+        if self.path is None or (not self.pending and not self.touched):
+            return
+
+        now = int(time.time())
+        try:
+            db = self.open()
+            db.executemany("INSERT OR REPLACE INTO word_diff VALUES (?, ?, ?, ?)",
+                           [(k, d, s, now) for (k, d, s) in self.pending])
+            db.executemany("UPDATE word_diff SET atime = ? WHERE key = ?",
+                           [(now, sqlite3.Binary(k)) for k in self.touched])
+            db.commit()
+        except sqlite3.Error:
+            self.disable()
+            return
+
+        self.pending = []
+        self.touched = []
+
+    def evict(self):
+        """Removes the entries older than max_days, then the least recently
+        used ones until the total size fits in max_bytes
+        """
+        if self.path is None:
+            return
+
+        try:
+            db = self.open()
+            db.execute("DELETE FROM word_diff WHERE atime < ?",
+                       (int(time.time()) - self.max_days * 86400,))
+
+            (count, size) = db.execute(
+                "SELECT COUNT(*), TOTAL(size) FROM word_diff").fetchone()
+            while size > self.max_bytes and count > 0:
+                # dropping the oldest tenth at a time
+                db.execute("DELETE FROM word_diff WHERE key IN (SELECT key FROM "
+                           "word_diff ORDER BY atime LIMIT ?)", (count // 10 + 1,))
+                (count, size) = db.execute(
+                    "SELECT COUNT(*), TOTAL(size) FROM word_diff").fetchone()
+
+            db.commit()
+        except sqlite3.Error:
+            self.disable()
+
+    def need_evict(self):
+        """Tells whether the limits are checked on close, which scans the
+        whole table for the total size
+        """
+        if self.written * self.EVICT_SAMPLE > self.max_bytes:
+            return True
+
+        return random.randrange(self.EVICT_SAMPLE) == 0
+
+    def close(self):
+        self.flush()
+        if self.need_evict():
+            self.evict()
+        self.disable()
+
+class Stats:
+    """Statistics of a run: wall time per phase, the slowest hunks, the
+    strategies and diff_match_patch paths used and the peak memory,
+    written as JSON
+    """
+
+    # Number of the slowest hunks reported individually
+    SLOWEST_HUNKS = 100
+
+    def __init__(self, path):
+        self.path = path
+        self.start = time.time()
+
+        self.phases = {}
+        self.hunks = 0
+        self.hunk_chars = 0
+        self.strategies = {}
+        # paths taken in diff_match_patch, counted by the instrumented
+        # instance and summed over the hunks, wherever computed
+        self.counters = {"shortcut": 0, "halfMatch": 0, "lineMode": 0,
+                         "bisect": 0, "bisect_iterations": 0, "timeout": 0,
+                         "expensive": 0, "onp": 0, "bitParallel": 0}
+        self.paths = dict.fromkeys(self.counters, 0)
+        # heap of (seconds, order, hunk info)
+        self.slowest = []
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def add_hunk(self, left_str, right_str, info, phase="word_diff"):
+        (seconds, strategy, paths) = info
+
+        self.hunks += 1
+        self.hunk_chars += len(left_str) + len(right_str)
+        self.strategies[strategy] = self.strategies.get(strategy, 0) + 1
+        self.add(phase, seconds)
+        for path in paths:
+            self.paths[path] += paths[path]
+
+        hunk = {"left_chars": len(left_str), "right_chars": len(right_str),
+                "seconds": round(seconds, 6), "strategy": strategy,
+                "paths": paths}
+        entry = (seconds, self.hunks, hunk)
+        if len(self.slowest) < self.SLOWEST_HUNKS:
+            heapq.heappush(self.slowest, entry)
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def instrument(self, proc):
+        """Counts the paths taken by the diff_match_patch instance from its
+        trace events
+        """
+        proc.Diff_Trace = self.trace
+
+    def trace(self, event, info):
+        counters = self.counters
+        if event in ("shortcut", "lineMode", "bitParallel"):
+            counters[event] += 1
+            if event == "bitParallel" and info["timeout"]:
+                counters["timeout"] += 1
+        elif event == "halfMatch":
+            if info["common"]:
+                counters["halfMatch"] += 1
+        elif event == "bisect":
+            counters["bisect"] += 1
+            counters["bisect_iterations"] += info["iterations"]
+            if info["timeout"]:
+                counters["timeout"] += 1
+            if info["expensive"]:
+                counters["expensive"] += 1
+        elif event == "onp":
+            counters["onp"] += 1
+            if info["timeout"]:
+                counters["timeout"] += 1
+
+    def report(self, diffc):
+        total = time.time() - self.start
+        phases = dict([(k, round(v, 6)) for (k, v) in self.phases.items()])
+        # the time spent in the workers overlaps the other phases
+        spent = sum([v for (k, v) in self.phases.items() if not k.startswith("worker_")])
+        phases["other"] = round(max(total - spent, 0.0), 6)
+
+        report = {
+            "total_seconds": round(total, 6),
+            "phases": phases,
+            "hunks": self.hunks,
+            "hunk_chars": self.hunk_chars,
+            "strategies": self.strategies,
+            "paths": self.paths,
+            "slowest_hunks": [x[2] for x in sorted(self.slowest, reverse=True)],
+            "cache": {"hits": diffc.cache.hits, "misses": diffc.cache.misses},
+            "jobs": diffc.jobs,
+        }
+
+        if diffc.file_cache is not None:
+            report["file_cache"] = {"hits": diffc.file_cache.hits,
+                                    "misses": diffc.file_cache.misses}
+
+        if resource is not None:
+            report["peak_rss_kb"] = {
+                "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+            }
+
+        return report
+
+    def write(self, diffc):
+        out = json.dumps(self.report(diffc), sort_keys=True)
+        if self.path == "-":
+            sys.stderr.write(out + "\n")
+            return
+
+        f = open(self.path, "w")
+        f.write(out + "\n")
+        f.close()
+
 class Diffc:
     """Class computing word diff and coloring the terminal output
     """
@@ -64,6 +439,28 @@ class Diffc:
 
     LINE_BREAK = "\n"
 
+    # Marker of a missing line break at the end of the file
+    NO_EOL = "\\ No newline at end of file"
+
+    # Hunks shorter than this are word diffed in place even with --jobs
+    PARALLEL_MIN_CHARS = 256
+
+    # Default size limits of the word diff and the line diff fallback
+    MAX_WORD_DIFF_CHARS = 100000
+    MAX_LINE_DIFF_CHARS = 10000000
+
+    # Default budget of the word diff cache
+    CACHE_ENTRIES = 4096
+    CACHE_BYTES = 64 * 1024 * 1024
+
+    # Default limits of the word diff cache file
+    CACHE_FILE_BYTES = 256 * 1024 * 1024
+    CACHE_FILE_DAYS = 30
+
+    # Number of distinct lines kept by the line encoder shared by the hunks
+    # of a file
+    ENCODER_LINES = 1000000
+
     def __init__(self):
         """Initilization of instance variables
         """
@@ -75,6 +472,37 @@ class Diffc:
         self.is_unified_diff_style = False
 
         self.word_diff_proc = diff_match_patch()
+        # The line diff of compare() is not bounded by the hunk budget, like
+        # the diff command
+        self.line_diff_proc = diff_match_patch()
+        self.line_diff_proc.Diff_Timeout = 0
+
+        # Number of worker processes computing the word diffs
+        self.jobs = 1
+        # Maximum number of hunks handed to the workers at a time
+        self.max_in_flight = 4
+
+        # Unit of the word diff, "char" or "word"
+        self.granularity = "char"
+        # Encoding of the raw hunk texts for the word diff, or None
+        self.encoding = "utf-8"
+
+        # Time by which the whole output has to be complete, or None.
+        # The budget of each hunk is word_diff_proc.Diff_Timeout.
+        self.deadline = None
+        # Hunks over these sizes are line diffed, or not highlighted at all
+        self.max_word_diff_chars = self.MAX_WORD_DIFF_CHARS
+        self.max_line_diff_chars = self.MAX_LINE_DIFF_CHARS
+
+        # Strategy used by the last compute_word_diff()
+        self.strategy = None
+        self.stats = None
+
+        self.cache = WordDiffCache(self.CACHE_ENTRIES, self.CACHE_BYTES)
+
+        self.file_cache = None
+        self.cache_file_bytes = self.CACHE_FILE_BYTES
+        self.cache_file_days = self.CACHE_FILE_DAYS
 
         self.color_info = Color.FG_CYAN
 
@@ -87,107 +515,552 @@ class Diffc:
     def color(self, input):
         """Appending color sequences to the input string
         """
-        output = []
+        return list(self.color_iter(input))
+
+    def color_iter(self, input):
+        """Generator version of color(), yielding the colored lines of each
+        hunk as soon as its closing line has been read
+        """
+        return self.color_items(self.scan(input))
 
-        self.check_diff_type(input)
+    def color_items(self, items):
+        """Coloring the output lines and hunks yielded by scan() or compare()
+        """
+        if self.jobs > 1 and multiprocessing is not None:
+            for r in self.color_items_parallel(items):
+                yield r
+            return
+
+        for item in items:
+            if type(item) is tuple:
+                for r in self.calc_word_diff(item):
+                    yield r
+            else:
+                yield item
+
+    def color_items_parallel(self, items):
+        """Same as color_items(), but computing the word diffs of the hunks in
+        a pool of worker processes.  At most max_in_flight hunks are handed
+        to the pool at a time, and the output is kept in the input order.
+        """
+        pool = multiprocessing.Pool(self.jobs, init_word_diff_worker, (self,))
+        # queue of output lines and (hunk, cache key, async result) tuples
+        pending = collections.deque()
+        in_flight = 0
+
+        try:
+            for item in items:
+                if type(item) is tuple:
+                    (left_str, right_str) = self.hunk_texts(item)
+                    (key, diffs) = self.cached_word_diff(left_str, right_str)
+                    if diffs is None and len(left_str) + len(right_str) < self.PARALLEL_MIN_CHARS:
+                        # not worth a round trip to the pool
+                        diffs = self.uncached_word_diff(key, left_str, right_str)
+                        pending.extend(self.timed_render_word_diff(item, diffs))
+                    elif diffs is None and len(left_str) + len(right_str) > self.word_diff_proc.Diff_ParallelChars:
+                        # split over the whole pool rather than sent to one
+                        # worker
+                        self.word_diff_proc.Diff_Map = pool.map
+                        try:
+                            diffs = self.uncached_word_diff(key, left_str, right_str)
+                        finally:
+                            self.word_diff_proc.Diff_Map = None
+                        pending.extend(self.timed_render_word_diff(item, diffs))
+                    elif diffs is not None:
+                        if self.stats is not None:
+                            self.stats.add_hunk(left_str, right_str, (0.0, "cache", {}))
+                        pending.extend(self.timed_render_word_diff(item, diffs))
+                    else:
+                        pending.append((item, key, pool.apply_async(
+                                word_diff_worker, (left_str, right_str))))
+                        in_flight += 1
+                else:
+                    pending.append(item)
+
+                # blocks on the oldest hunk only when too many are in flight
+                while pending:
+                    if type(pending[0]) is not tuple:
+                        yield pending.popleft()
+                    elif pending[0][2].ready() or in_flight >= self.max_in_flight:
+                        (hunk, key, result) = pending.popleft()
+                        in_flight -= 1
+                        for r in self.word_diff_result(hunk, key, result):
+                            yield r
+                    else:
+                        break
+
+            while pending:
+                if type(pending[0]) is not tuple:
+                    yield pending.popleft()
+                else:
+                    (hunk, key, result) = pending.popleft()
+                    for r in self.word_diff_result(hunk, key, result):
+                        yield r
+
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def word_diff_result(self, hunk, key, result):
+        """Waits for the word diff of a hunk computed by a worker and returns
+        the rendered lines
+        """
+        if self.stats is not None:
+            start = time.time()
+
+        (diffs, complete, info) = result.get()
+        if complete:
+            self.cache_word_diff(key, diffs)
+
+        if self.stats is None:
+            return self.render_word_diff(hunk, diffs)
+
+        self.stats.add("wait", time.time() - start)
+        (left_str, right_str) = self.hunk_texts(hunk)
+        self.stats.add_hunk(left_str, right_str, info, "worker_word_diff")
+
+        return self.timed_render_word_diff(hunk, diffs)
+
+    def scan(self, input):
+        """Classifying the input lines.  Yields output lines as is, and the
+        buffered (left_buf, center_buf, right_buf) tuple for each hunk
+        to be word diffed.
+        """
+        self.reset_line_encoder()
 
         for line in input:
+            # the diff type is detected from the first line telling it,
+            # usually the first range line
+            self.check_diff_type((line,))
+
             if self.is_info(line):
-                output += self.calc_word_diff()
-                output += [ self.color_info + line + Color.DEFAULT ]
+                for r in self.take_hunk():
+                    yield r
+                yield self.color_info + line + Color.DEFAULT
                 continue
 
             if self.is_traditional_diff_style:
-                if self.P_TRD_LEFT.match(line):
-                    self.left_buf += [line]
+                if line.startswith("<"):
+                    self.left_buf.append(line)
                     continue
 
-                if self.P_TRD_RIGHT.match(line):
-                    self.right_buf += [line]
+                if line.startswith(">"):
+                    self.right_buf.append(line)
                     continue
 
-                if self.P_TRD_SEPARATOR.match(line):
-                    self.center_buf += [line]
+                if line.startswith("-") and self.P_TRD_SEPARATOR.match(line):
+                    self.center_buf.append(line)
                     continue
 
             if self.is_unified_diff_style:
-                if self.P_UNI_LEFT.match(line):
-                    self.left_buf += [line]
+                if line.startswith("-"):
+                    self.left_buf.append(line)
                     continue
 
-                if self.P_UNI_RIGHT.match(line):
-                    self.right_buf += [line]
+                if line.startswith("+"):
+                    self.right_buf.append(line)
                     continue
 
-            output += self.calc_word_diff()
-            output += [line]
+            # the marker of the left side stays within the hunk
+            if line == self.NO_EOL and self.left_buf and not self.right_buf:
+                self.center_buf.append(line)
+                continue
+
+            for r in self.take_hunk():
+                yield r
+            yield line
 
-        output += self.calc_word_diff()
+            # the lines of the next file are encoded from scratch
+            if line.startswith("diff "):
+                self.reset_line_encoder()
 
-        return output
+        for r in self.take_hunk():
+            yield r
 
-    def calc_word_diff(self):
+    def take_hunk(self):
+        """Returns the buffered hunk as a one element list, or the buffered
+        separator lines if there is nothing to word diff
+        """
         if not self.left_buf and not self.right_buf :
-            return self.center_buf
+            ret = self.center_buf
+            self.center_buf = []
+            return ret
 
-        ret = []
+        hunk = (self.left_buf, self.center_buf, self.right_buf)
 
-        left_str = ""
-        right_str = ""
+        self.left_buf = []
+        self.center_buf = []
+        self.right_buf = []
 
-        left_header = ""
-        right_header = ""
+        return [hunk]
 
+    def headers(self):
         if self.is_traditional_diff_style:
-            left_header = "< "
-            right_header = "> "
+            return ("< ", "> ")
         elif self.is_unified_diff_style:
-            left_header = "\\-"
-            right_header = "\\+"
-        
-        left_str = self.LINE_BREAK.join( map(lambda x: re.sub("^" + left_header, "", x), self.left_buf) )
-        right_str = self.LINE_BREAK.join( map(lambda x: re.sub("^" + right_header, "", x), self.right_buf) )
-
-        diffs = self.word_diff_proc.diff_main(left_str, right_str)
-        
-        left_colored_strs = []
-        right_colored_strs = []
+            return ("-", "+")
+
+        return ("", "")
+
+    def hunk_texts(self, hunk):
+        """Returns the left and right texts of the hunk without the headers
+        """
+        (left_buf, center_buf, right_buf) = hunk
+        (left_header, right_header) = self.headers()
+
+        def strip(buf, header):
+            n = len(header)
+            for x in buf:
+                if x.startswith(header):
+                    yield x[n:]
+                else:
+                    yield x
+
+        left_str = self.LINE_BREAK.join(strip(left_buf, left_header))
+        right_str = self.LINE_BREAK.join(strip(right_buf, right_header))
+
+        return self.decode(left_str, right_str)
+
+    def io_encoding(self):
+        """Returns the encoding of the input and output on Python 3, where the
+        lines are handled as str, the undecodable bytes going through as
+        surrogates, or None on Python 2, where they are kept as bytes
+        """
+        if bytes is str:
+            return None
+
+        # latin-1 maps each raw byte to a character
+        return self.encoding or "latin-1"
+
+    def decode(self, left_str, right_str):
+        """Decodes the raw hunk texts so that the word diff does not split
+        multibyte characters.  Both are left as is if either one cannot be
+        decoded.
+        """
+        if not self.encoding or not isinstance(left_str, bytes) \
+                or not isinstance(right_str, bytes):
+            return (left_str, right_str)
+
+        try:
+            return (left_str.decode(self.encoding), right_str.decode(self.encoding))
+        except UnicodeDecodeError:
+            return (left_str, right_str)
+
+    def word_diff(self, left_str, right_str):
+        """Returns the diffs of the hunk texts, or None if the hunk is not
+        to be highlighted
+        """
+        (key, diffs) = self.cached_word_diff(left_str, right_str)
+        if diffs is not None:
+            if self.stats is not None:
+                self.stats.add_hunk(left_str, right_str, (0.0, "cache", {}))
+            return diffs
+
+        return self.uncached_word_diff(key, left_str, right_str)
+
+    def uncached_word_diff(self, key, left_str, right_str):
+        """Computes the diffs of the hunk texts missing from the caches and
+        caches them under key when complete
+        """
+        if self.stats is None:
+            (diffs, complete) = self.compute_word_diff(left_str, right_str)
+        else:
+            (diffs, complete, info) = self.measured_word_diff(left_str, right_str)
+            self.stats.add_hunk(left_str, right_str, info)
+
+        if complete:
+            self.cache_word_diff(key, diffs)
+
+        return diffs
+
+    def compute_word_diff(self, left_str, right_str):
+        """Computes the word diff within the time budgets, falling back to a
+        line diff for the hunks over max_word_diff_chars or running out of
+        time, and to no highlighting at all for the hunks over
+        max_line_diff_chars or past the global deadline.
+        Returns the diffs, or None, and whether the result does not depend
+        on the time budgets.
+        """
+        self.strategy = "none"
+
+        size = len(left_str) + len(right_str)
+        if size > self.max_line_diff_chars:
+            return (None, True)
+
+        deadline = self.hunk_deadline()
+        if deadline is not None and time.time() >= deadline:
+            return (None, False)
+
+        if size <= self.max_word_diff_chars:
+            diffs = self.diff_words(left_str, right_str, deadline)
+            if deadline is None or time.time() < deadline:
+                self.strategy = self.granularity
+                return (diffs, True)
+
+            # ran out of time, the diff may have been cut short.  The line
+            # diff past the deadline only keeps the common lines at the ends,
+            # it is cheap
+            if self.deadline is not None and time.time() >= self.deadline:
+                return (None, False)
+
+            self.strategy = "line"
+            return (self.diff_lines(left_str, right_str, deadline), False)
+
+        self.strategy = "line"
+        diffs = self.diff_lines(left_str, right_str, deadline)
+
+        return (diffs, deadline is None or time.time() < deadline)
+
+    def measured_word_diff(self, left_str, right_str):
+        """compute_word_diff() also returning its duration, strategy and the
+        paths taken in diff_match_patch for the statistics
+        """
+        paths = self.stats.counters.copy()
+        start = time.time()
+        (diffs, complete) = self.compute_word_diff(left_str, right_str)
+        seconds = time.time() - start
+
+        for path in paths:
+            paths[path] = self.stats.counters[path] - paths[path]
+
+        return (diffs, complete, (seconds, self.strategy, paths))
+
+    def hunk_deadline(self):
+        """Returns the time by which the word diff of a hunk started now has
+        to be complete, or None if unlimited
+        """
+        deadline = self.deadline
+        if self.word_diff_proc.Diff_Timeout > 0:
+            hunk_deadline = time.time() + self.word_diff_proc.Diff_Timeout
+            if deadline is None or hunk_deadline < deadline:
+                deadline = hunk_deadline
+
+        return deadline
+
+    def diff_words(self, left_str, right_str, deadline):
+        proc = self.word_diff_proc
+        # the line mode of diff_main encodes the lines with it
+        self.shared_line_encoder()
+        if self.granularity != "word":
+            return proc.diff_main(left_str, right_str, True, deadline)
+
+        # diffing the sequences of tokens instead of the characters
+        (chars1, chars2, token_array) = proc.diff_wordsToChars(left_str, right_str)
+        diffs = proc.diff_main(chars1, chars2, False, deadline)
+        proc.diff_charsToLines(diffs, token_array)
+
+        return diffs
+
+    def diff_lines(self, left_str, right_str, deadline):
+        """Line diff of the hunk texts, highlighting the changed lines as a
+        whole
+        """
+        proc = self.word_diff_proc
+        encoder = self.shared_line_encoder()
+
+        # terminating the last lines so that they compare like the others
+        ids1 = encoder.encode_lines(left_str + self.LINE_BREAK)
+        ids2 = encoder.encode_lines(right_str + self.LINE_BREAK)
+        diffs = self.line_ids_diff(proc, encoder, ids1, ids2,
+                                   len(left_str) + len(right_str), deadline)
+        proc.diff_charsToItems(diffs, ids1, ids2, encoder.items)
+
+        # removing the added line break from the end of each side, an
+        # equality keeping on one side only past the end of the other
+        result = []
+        (end1, end2) = (len(left_str), len(right_str))
+        (pos1, pos2) = (0, 0)
         for (op, data) in diffs:
-            if op == self.word_diff_proc.DIFF_INSERT:
-                right_colored_strs += [self.append_color(data, self.color_right_diff)]
-            elif op == self.word_diff_proc.DIFF_DELETE:
-                left_colored_strs += [self.append_color(data, self.color_left_diff)]
-            elif op == self.word_diff_proc.DIFF_EQUAL:
-                left_colored_strs += [self.append_color(data, self.color_left_context)]
-                right_colored_strs += [self.append_color(data, self.color_right_context)]
+            parts = []
+            if op == proc.DIFF_EQUAL:
+                keep1 = min(len(data), max(end1 - pos1, 0))
+                keep2 = min(len(data), max(end2 - pos2, 0))
+                common = min(keep1, keep2)
+                parts = [(op, data[:common]),
+                         (proc.DIFF_DELETE, data[common:keep1]),
+                         (proc.DIFF_INSERT, data[common:keep2])]
+                pos1 += len(data)
+                pos2 += len(data)
+            elif op == proc.DIFF_DELETE:
+                parts = [(op, data[:max(end1 - pos1, 0)])]
+                pos1 += len(data)
+            else:
+                parts = [(op, data[:max(end2 - pos2, 0)])]
+                pos2 += len(data)
+
+            for (op, data) in parts:
+                if not data:
+                    continue
+                if result and result[-1][0] == op:
+                    result[-1] = (op, result[-1][1] + data)
+                else:
+                    result.append((op, data))
 
-        ret += self.split_into_diff_lines(left_header.replace("\\", ""), self.color_left_context, "".join(left_colored_strs))
-        ret += self.center_buf
-        ret += self.split_into_diff_lines(right_header.replace("\\", ""), self.color_right_context, "".join(right_colored_strs))
+        return result
+
+    def shared_line_encoder(self):
+        """Returns the line encoder shared by the line diffs of the hunks of
+        a file, started over once it holds ENCODER_LINES lines
+        """
+        encoder = self.word_diff_proc.Diff_LineEncoder
+        if encoder is None or len(encoder.items) > self.ENCODER_LINES:
+            encoder = self.reset_line_encoder()
+
+        return encoder
+
+    def reset_line_encoder(self):
+        """Starts over the line encoder shared by the hunks, at each file
+        """
+        self.word_diff_proc.Diff_LineEncoder = sequence_encoder()
 
-        self.clear_buf()
+        return self.word_diff_proc.Diff_LineEncoder
+
+    def word_diff_settings(self):
+        """Returns the settings affecting the result of the word diff
+        """
+        proc = self.word_diff_proc
+        return (proc.Diff_Timeout, proc.Diff_EditCost, self.granularity, self.encoding,
+                self.max_word_diff_chars, self.max_line_diff_chars,
+                proc.Diff_LineAlgorithm, proc.Diff_BisectCost, proc.Diff_Algorithm,
+                proc.Diff_HalfMatchChars)
+
+    def cached_word_diff(self, left_str, right_str):
+        """Returns the cache key and the cached diffs, or None for both
+        if the cache is disabled
+        """
+        if self.cache.max_entries <= 0 and self.file_cache is None:
+            return (None, None)
+
+        key = self.cache.key(left_str, right_str, self.word_diff_settings())
+
+        diffs = None
+        if self.cache.max_entries > 0:
+            diffs = self.cache.get(key)
+
+        if diffs is None and self.file_cache is not None:
+            diffs = self.file_cache.get(key, left_str, right_str)
+            if diffs is not None:
+                self.cache.put(key, diffs)
+
+        return (key, diffs)
+
+    def cache_word_diff(self, key, diffs):
+        if key is None or diffs is None:
+            return
+
+        self.cache.put(key, diffs)
+        if self.file_cache is not None:
+            self.file_cache.put(key, diffs)
+
+    def close(self):
+        """Writes back the cache file and the statistics, if any
+        """
+        if self.file_cache is not None:
+            self.file_cache.close()
+
+        if self.stats is not None:
+            self.stats.write(self)
+            self.stats = None
+
+        self.file_cache = None
+
+    def calc_word_diff(self, hunk):
+        (left_str, right_str) = self.hunk_texts(hunk)
+
+        return self.timed_render_word_diff(hunk, self.word_diff(left_str, right_str))
+
+    def timed_render_word_diff(self, hunk, diffs):
+        """render_word_diff() accounting its time in the statistics
+        """
+        if self.stats is None:
+            return self.render_word_diff(hunk, diffs)
+
+        start = time.time()
+        ret = self.render_word_diff(hunk, diffs)
+        self.stats.add("render", time.time() - start)
 
         return ret
 
-    def append_color(self, str, color):
-        if len(str) == 0:
-            return str
+    def render_word_diff(self, hunk, diffs):
+        """Renders the colored lines of the hunk in a single pass over the
+        diffs, each output line being joined once from its segments
+        """
+        (left_buf, center_buf, right_buf) = hunk
+        (left_header, right_header) = self.headers()
+        proc = self.word_diff_proc
+
+        left_prefix = self.color_left_context + left_header + Color.DEFAULT
+        right_prefix = self.color_right_context + right_header + Color.DEFAULT
+
+        left_lines = []
+        right_lines = []
+        left_line = [left_prefix]
+        right_line = [right_prefix]
+
+        if diffs is None:
+            # no highlighting, only the colors of the sides
+            (left_str, right_str) = self.hunk_texts(hunk)
+            left_line = self.append_segment(left_lines, left_line, left_prefix,
+                                            self.color_left_context, left_str)
+            right_line = self.append_segment(right_lines, right_line, right_prefix,
+                                             self.color_right_context, right_str)
+            diffs = []
 
-        return color + str.replace(self.LINE_BREAK, Color.DEFAULT + self.LINE_BREAK + color) + Color.DEFAULT
+        for (op, data) in diffs:
+            if op == proc.DIFF_INSERT:
+                right_line = self.append_segment(right_lines, right_line, right_prefix,
+                                                 self.color_right_diff, data)
+            elif op == proc.DIFF_DELETE:
+                left_line = self.append_segment(left_lines, left_line, left_prefix,
+                                                self.color_left_diff, data)
+            elif op == proc.DIFF_EQUAL:
+                left_line = self.append_segment(left_lines, left_line, left_prefix,
+                                                self.color_left_context, data)
+                right_line = self.append_segment(right_lines, right_line, right_prefix,
+                                                 self.color_right_context, data)
+
+        # a side made of a single empty line still has to be output
+        if left_buf:
+            left_lines.append("".join(left_line))
+        if right_buf:
+            right_lines.append("".join(right_line))
+
+        # encoding back the lines of decoded texts
+        if self.encoding and isinstance((left_buf or right_buf)[0], bytes):
+            for lines in (left_lines, right_lines):
+                for i in range(len(lines)):
+                    if not isinstance(lines[i], bytes):
+                        lines[i] = lines[i].encode(self.encoding)
+
+        return left_lines + center_buf + right_lines
+
+    def append_segment(self, lines, line, prefix, color, data):
+        """Appends the colored data to the segments of the line being built,
+        moving the completed lines to lines at each line break.
+        Returns the segments of the line being built.
+        """
+        if not data:
+            return line
 
-    def split_into_diff_lines(self, header_str, color, base_str):
-        if not base_str:
-            return []
+        start = 0
+        end = data.find(self.LINE_BREAK)
+        while end != -1:
+            line += [color, data[start:end], Color.DEFAULT]
+            lines.append("".join(line))
+            line = [prefix]
+            start = end + 1
+            end = data.find(self.LINE_BREAK, start)
 
-        return map(lambda x: ''.join(
-                [color, header_str, Color.DEFAULT, x]), base_str.split(self.LINE_BREAK))
+        line += [color, data[start:], Color.DEFAULT]
 
-    def clear_buf(self):
-        self.left_buf[:] = []
-        self.center_buf[:] = []
-        self.right_buf[:] = []
+        return line
 
     def is_info(self, line):
+        # the range lines start with a digit or "@@"
+        if not line[:1].isdigit() and not line.startswith("@@"):
+            return False
+
         if self.P_TRD_RANGE.match(line) or self.P_UNI_RANGE.match(line):
             return True
 
@@ -218,6 +1091,359 @@ class Diffc:
                 self.is_unified_diff_style = True
                 return
 
+    def set_jobs(self, jobs):
+        if jobs <= 0 and multiprocessing is not None:
+            jobs = multiprocessing.cpu_count()
+
+        self.jobs = max(jobs, 1)
+        self.max_in_flight = self.jobs * 4
+
+    def set_timeout(self, seconds):
+        self.deadline = None
+        if seconds > 0:
+            self.deadline = time.time() + seconds
+
+    def set_hunk_timeout(self, seconds):
+        self.word_diff_proc.Diff_Timeout = seconds
+
+    def set_bisect_cost(self, cost):
+        self.word_diff_proc.Diff_BisectCost = max(cost, 0)
+
+    def set_half_match_chars(self, size):
+        self.word_diff_proc.Diff_HalfMatchChars = max(size, 0)
+
+    def set_max_word_diff_chars(self, size):
+        self.max_word_diff_chars = size
+
+    def set_max_line_diff_chars(self, size):
+        self.max_line_diff_chars = size
+
+    def set_encoding(self, encoding):
+        if encoding:
+            # raises LookupError for an unknown encoding
+            encoding = codecs.lookup(encoding).name
+        self.encoding = encoding or None
+
+    def set_stats(self, path):
+        self.stats = None
+        if path:
+            self.stats = Stats(path)
+            self.stats.instrument(self.word_diff_proc)
+
+    def set_granularity(self, granularity):
+        if granularity not in ("char", "word"):
+            raise ValueError("unknown granularity: " + granularity)
+
+        self.granularity = granularity
+
+    def set_line_algorithm(self, algorithm):
+        if algorithm not in ("myers", "patience", "histogram"):
+            raise ValueError("unknown line algorithm: " + algorithm)
+
+        self.word_diff_proc.Diff_LineAlgorithm = algorithm
+        self.line_diff_proc.Diff_LineAlgorithm = algorithm
+
+    def set_cache_entries(self, entries):
+        self.cache.max_entries = entries
+
+    def set_cache_bytes(self, size):
+        self.cache.max_bytes = size
+
+    def set_cache_file(self, path):
+        if sqlite3 is None or not path:
+            self.file_cache = None
+            return
+
+        self.file_cache = FileWordDiffCache(path, self.cache_file_bytes, self.cache_file_days)
+
+    def set_cache_file_bytes(self, size):
+        self.cache_file_bytes = size
+        if self.file_cache is not None:
+            self.file_cache.max_bytes = size
+
+    def set_cache_file_days(self, days):
+        self.cache_file_days = days
+        if self.file_cache is not None:
+            self.file_cache.max_days = days
+
+    def parse_args(self, args):
+        """Consumes the diffc options and returns the remaining arguments,
+        which are passed to the diff command
+        """
+        # option -> (setter, type of the value)
+        options = {
+            "--jobs": (self.set_jobs, int),
+            "--granularity": (self.set_granularity, str),
+            "--line-algorithm": (self.set_line_algorithm, str),
+            "--encoding": (self.set_encoding, str),
+            "--stats": (self.set_stats, str),
+            "--timeout": (self.set_timeout, float),
+            "--hunk-timeout": (self.set_hunk_timeout, float),
+            "--bisect-cost": (self.set_bisect_cost, int),
+            "--half-match-chars": (self.set_half_match_chars, int),
+            "--max-word-diff-chars": (self.set_max_word_diff_chars, int),
+            "--max-line-diff-chars": (self.set_max_line_diff_chars, int),
+            "--cache-entries": (self.set_cache_entries, int),
+            "--cache-bytes": (self.set_cache_bytes, int),
+            "--cache-file": (self.set_cache_file, str),
+            "--cache-file-bytes": (self.set_cache_file_bytes, int),
+            "--cache-file-days": (self.set_cache_file_days, int),
+        }
+
+        for option in options:
+            env = "DIFFC_" + option[2:].replace("-", "_").upper()
+            if env in os.environ:
+                (setter, value_type) = options[option]
+                setter(value_type(os.environ[env]))
+
+        rest = []
+        i = 0
+        while i < len(args):
+            if args[i] in options and i + 1 < len(args):
+                (setter, value_type) = options[args[i]]
+                setter(value_type(args[i + 1]))
+                i += 2
+                continue
+
+            (option, sep, value) = args[i].partition("=")
+            if sep and option in options:
+                (setter, value_type) = options[option]
+                setter(value_type(value))
+                i += 1
+                continue
+
+            rest.append(args[i])
+            i += 1
+
+        return rest
+
+    def compare(self, args):
+        """Computes the diff of two files in process when the arguments are
+        two regular files, optionally preceded by -u or -U NUM.
+        Returns an iterator of the output lines and hunks like scan(), or
+        None if the external diff command has to be used instead.
+        """
+        if 'DIFFC_DIFF_CMD' in os.environ:
+            return None
+
+        context = None
+        if len(args) == 3 and args[0] == "-u":
+            context = 3
+        elif len(args) == 3 and args[0].startswith("-U") and args[0][2:].isdigit():
+            context = int(args[0][2:])
+        elif len(args) == 4 and args[0] == "-U" and args[1].isdigit():
+            context = int(args[1])
+        elif len(args) != 2:
+            return None
+
+        (path1, path2) = args[-2:]
+        if not os.path.isfile(path1) or not os.path.isfile(path2):
+            return None
+
+        start = time.time()
+        with open(path1, "rb") as f:
+            text1 = f.read()
+        with open(path2, "rb") as f:
+            text2 = f.read()
+        if self.stats is not None:
+            self.stats.add("read", time.time() - start)
+
+        # leaving the binary files to the diff command
+        if b"\0" in text1 or b"\0" in text2:
+            return None
+
+        encoding = self.io_encoding()
+        if encoding is not None:
+            text1 = text1.decode(encoding, "surrogateescape")
+            text2 = text2.decode(encoding, "surrogateescape")
+
+        self.is_traditional_diff_style = context is None
+        self.is_unified_diff_style = context is not None
+        self.reset_line_encoder()
+
+        start = time.time()
+        if (self.jobs > 1 and multiprocessing is not None and
+                len(text1) + len(text2) > self.line_diff_proc.Diff_ParallelChars):
+            changes = self.parallel_line_changes(text1, text2)
+        else:
+            changes = self.line_changes(text1, text2)
+        if self.stats is not None:
+            self.stats.add("line_diff", time.time() - start)
+
+        if context is None:
+            return self.normal_diff(changes)
+
+        return self.unified_diff(changes, path1, path2, context)
+
+    def line_changes(self, text1, text2):
+        """Computes the line diff of two texts.
+        Returns the lines of both texts and the list of changes as
+        (start1, end1, start2, end2) tuples of line indexes.
+        """
+        proc = self.line_diff_proc
+        encoder = sequence_encoder()
+        ids1 = encoder.encode_lines(text1)
+        ids2 = encoder.encode_lines(text2)
+        diffs = self.line_ids_diff(proc, encoder, ids1, ids2,
+                                   len(text1) + len(text2))
+
+        lines1 = [encoder.items[i] for i in ids1]
+        lines2 = [encoder.items[i] for i in ids2]
+
+        changes = [opcode[1:] for opcode in proc.diff_toOpcodes(diffs)
+                   if opcode[0] != "equal"]
+
+        return (lines1, lines2, changes)
+
+    def line_ids_diff(self, proc, encoder, ids1, ids2, size, deadline=None):
+        """Line diff of the line ids of two texts of size characters in
+        total, diffing the segments between unique common lines through
+        proc.Diff_Map when set and the texts are long enough
+        """
+        if proc.Diff_Map is not None and size > proc.Diff_ParallelChars:
+            lengths = [len(item) for item in encoder.items]
+            diffs = proc.diff_parallelIds(ids1, ids2, lengths, deadline)
+            if diffs is not None:
+                return diffs
+
+        return proc.diff_lineIds(ids1, ids2, deadline)
+
+    def parallel_line_changes(self, text1, text2):
+        """Same as line_changes(), but diffing the segments of long texts in
+        a pool of worker processes
+        """
+        pool = multiprocessing.Pool(self.jobs, init_word_diff_worker, (self,))
+        try:
+            self.line_diff_proc.Diff_Map = pool.map
+            changes = self.line_changes(text1, text2)
+            pool.close()
+        finally:
+            self.line_diff_proc.Diff_Map = None
+            pool.terminate()
+            pool.join()
+
+        return changes
+
+    def side_lines(self, header, lines, start, end):
+        """Returns the lines of a side of a hunk, and whether the last one is
+        missing the line break at the end of the file.  A carriage return is
+        kept like the diff command does.
+        """
+        buf = [header + x.rstrip("\n") for x in lines[start:end]]
+
+        return (buf, start < end and not lines[end - 1].endswith("\n"))
+
+    def normal_diff(self, changes):
+        """Yields the output lines and hunks in the traditional diff format
+        """
+        (lines1, lines2, changes) = changes
+
+        def range_str(start, end):
+            if end - start == 1:
+                return "%d" % end
+            return "%d,%d" % (start + 1, end)
+
+        for (i1, i2, j1, j2) in changes:
+            if i1 == i2:
+                info = "%da%s" % (i1, range_str(j1, j2))
+            elif j1 == j2:
+                info = "%sd%d" % (range_str(i1, i2), j1)
+            else:
+                info = "%sc%s" % (range_str(i1, i2), range_str(j1, j2))
+            yield self.color_info + info + Color.DEFAULT
+
+            (left, left_no_eol) = self.side_lines("< ", lines1, i1, i2)
+            (right, right_no_eol) = self.side_lines("> ", lines2, j1, j2)
+
+            # the marker of the left side stays within the hunk
+            hunk = (left, [], right)
+            if left_no_eol:
+                hunk[1].append(self.NO_EOL)
+            if left and right:
+                hunk[1].append("---")
+
+            for r in self.flush_hunk(hunk):
+                yield r
+            if right_no_eol:
+                yield self.NO_EOL
+
+    def unified_diff(self, changes, path1, path2, context):
+        """Yields the output lines and hunks in the unified diff format
+        """
+        (lines1, lines2, changes) = changes
+        if not changes:
+            return
+
+        def file_time(path):
+            st = os.stat(path)
+            if hasattr(st, "st_mtime_ns"):
+                (mtime, nsec) = divmod(st.st_mtime_ns, 1000000000)
+                fraction = "%09d" % nsec
+            else:
+                # a float only holds about microseconds
+                (mtime, usec) = divmod(int(round(st.st_mtime * 1000000)), 1000000)
+                fraction = "%06d000" % usec
+            return "%s.%s %s" % (
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(mtime)),
+                fraction,
+                time.strftime("%z", time.localtime(mtime)))
+
+        def range_str(start, end):
+            if end - start == 1:
+                return "%d" % end
+            if end == start:
+                return "%d,0" % start
+            return "%d,%d" % (start + 1, end - start)
+
+        yield (["--- %s\t%s" % (path1, file_time(path1))], [],
+               ["+++ %s\t%s" % (path2, file_time(path2))])
+
+        # grouping the changes whose contexts overlap into hunks
+        groups = [[changes[0]]]
+        for change in changes[1:]:
+            if change[0] - groups[-1][-1][1] > 2 * context:
+                groups.append([])
+            groups[-1].append(change)
+
+        for group in groups:
+            i1 = max(group[0][0] - context, 0)
+            i2 = min(group[-1][1] + context, len(lines1))
+            j1 = i1 + group[0][2] - group[0][0]
+            j2 = i2 + group[-1][3] - group[-1][1]
+            yield self.color_info + "@@ -%s +%s @@" % (
+                range_str(i1, i2), range_str(j1, j2)) + Color.DEFAULT
+
+            # the last change is a dummy one for the trailing context
+            i = i1
+            for (c1, c2, d1, d2) in group + [(i2, i2, j2, j2)]:
+                (same, same_no_eol) = self.side_lines(" ", lines1, i, c1)
+                for r in same:
+                    yield r
+                if same_no_eol:
+                    yield self.NO_EOL
+
+                (left, left_no_eol) = self.side_lines("-", lines1, c1, c2)
+                (right, right_no_eol) = self.side_lines("+", lines2, d1, d2)
+
+                hunk = (left, [], right)
+                if left_no_eol:
+                    hunk[1].append(self.NO_EOL)
+
+                for r in self.flush_hunk(hunk):
+                    yield r
+                if right_no_eol:
+                    yield self.NO_EOL
+
+                i = c2
+
+    def flush_hunk(self, hunk):
+        """Returns the hunk as a one element list unless it is empty
+        """
+        if not hunk[0] and not hunk[2]:
+            return hunk[1]
+
+        return [hunk]
+
     def diff(self, args):
         diff_cmd = "diff"
         if 'DIFFC_DIFF_CMD' in os.environ:
@@ -225,10 +1451,113 @@ class Diffc:
 
         args.insert(0, diff_cmd)
 
-        result = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT).stdout.readlines()
+        # the pipe is returned as is so that the output can be consumed
+        # while diff is still running
+        result = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT).stdout
 
         return result
 
+class OutputBuffer:
+    """Batching the output lines into large writes.  With an encoding, the
+    lines are str encoded with it, the surrogates of read_lines() going back
+    to the original bytes.
+    """
+
+    def __init__(self, out, size, stats=None, encoding=None):
+        self.out = out
+        self.size = size
+        self.stats = stats
+        self.encoding = encoding
+
+        self.lines = []
+        self.length = 0
+
+    def write(self, line):
+        self.lines.append(line)
+        self.length += len(line) + 1
+
+        if self.length >= self.size:
+            self.flush()
+
+    def flush(self):
+        start = time.time()
+
+        if self.lines:
+            if self.encoding is not None:
+                self.out.write(("\n".join(self.lines) + "\n").encode(
+                    self.encoding, "surrogateescape"))
+            else:
+                self.lines.append(b"")
+                self.out.write(b"\n".join(self.lines))
+            self.lines = []
+            self.length = 0
+
+        self.out.flush()
+
+        if self.stats is not None:
+            self.stats.add("write", time.time() - start)
+
+def read_lines(fd, before_read=None, size=65536, stats=None, encoding=None):
+    """Reads the raw lines from a file descriptor in large blocks, without
+    the line endings.  before_read is called before each read, which may
+    block.  The time spent reading is added to stats, if any.  With an
+    encoding, the lines are decoded into str, the undecodable bytes being
+    kept as surrogates.
+    """
+    rest = b""
+    while True:
+        if before_read is not None:
+            before_read()
+
+        start = time.time()
+        block = os.read(fd, size)
+        if stats is not None:
+            stats.add("read", time.time() - start)
+        if not block:
+            break
+
+        if rest:
+            block = rest + block
+
+        start = 0
+        end = block.find(b"\n")
+        while end != -1:
+            line = block[start:end]
+            if line.endswith(b"\r"):
+                line = line.rstrip(b"\r\n")
+            if encoding is not None:
+                line = line.decode(encoding, "surrogateescape")
+            yield line
+
+            start = end + 1
+            end = block.find(b"\n", start)
+
+        rest = block[start:]
+
+    if rest:
+        rest = rest.rstrip(b"\r\n")
+        if encoding is not None:
+            rest = rest.decode(encoding, "surrogateescape")
+        yield rest
+
+worker_diffc = None
+
+def init_word_diff_worker(diffc):
+    """Initializer of the word diff worker processes
+    """
+    global worker_diffc
+
+    # interruption is handled by the parent process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    worker_diffc = diffc
+
+def word_diff_worker(left_str, right_str):
+    if worker_diffc.stats is not None:
+        return worker_diffc.measured_word_diff(left_str, right_str)
+
+    return worker_diffc.compute_word_diff(left_str, right_str) + (None,)
+
 def signal_handler(signum, frame):
     print("Interrupted.")
     sys.exit(0)
@@ -239,16 +1568,30 @@ def main():
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGQUIT, signal_handler)
 
-    lines = []
-    if len(sys.argv) > 1 :
-        lines = d.diff(sys.argv[1:])
-    else:
-        lines = sys.stdin.readlines()
+    args = d.parse_args(sys.argv[1:])
+
+    items = None
+    if len(args) > 0 :
+        items = d.compare(args)
+
+    # written in large batches, flushed before waiting for more input
+    out = OutputBuffer(getattr(sys.stdout, "buffer", sys.stdout), 65536, d.stats,
+                       d.io_encoding())
+
+    if items is None:
+        stream = sys.stdin
+        if len(args) > 0 :
+            stream = d.diff(args)
+
+        items = d.scan(read_lines(stream.fileno(), out.flush, stats=d.stats,
+                                  encoding=d.io_encoding()))
 
-    input = map(lambda x: re.sub("[\r\n]*$","",x), lines)
-    output = d.color(input)
-    for r in output :
-        print(r)
+    try:
+        for r in d.color_items(items) :
+            out.write(r)
+        out.flush()
+    finally:
+        d.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,296 @@
+#!/usr/bin/python2.7
+
+""" diffc benchmarks
+
+Measures the throughput, the time to the first output line and the peak
+memory of Diffc.color and of the diffc script on generated corpora, and on
+recorded diffs given with --corpus.  Each measurement runs in a separate
+process so that the peak memory of one does not hide another's.
+
+Prints one JSON object per measurement.
+
+ python diffc_bench.py [--scale N] [--corpus FILE]... [--output FILE] [NAME]...
+
+With --cleanup, measures instead the diff_match_patch cleanup passes on
+diffs of growing numbers of small edits: the time per diff stays flat when
+a pass is linear.
+
+ python diffc_bench.py --cleanup [--scale N] [--output FILE]
+
+"""
+
+import sys
+import os
+import json
+import random
+import resource
+import subprocess
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import diffc
+
+WORDS = ["self", "return", "if", "else", "for", "in", "x", "y", "value",
+         "result", "=", "+", "(", ")", "[", "]", ":", ",", "0", "1", "None"]
+
+def random_line(rand, words):
+    return " ".join([rand.choice(WORDS) for i in range(words)])
+
+def edit_line(rand, line):
+    words = line.split(" ")
+    for i in range(max(1, len(words) // 8)):
+        words[rand.randrange(len(words))] = rand.choice(WORDS)
+    return " ".join(words)
+
+def unified_hunk(rand, lines, start, words):
+    old = [random_line(rand, words) for i in range(lines)]
+    new = [edit_line(rand, x) for x in old]
+    return (["@@ -%d,%d +%d,%d @@" % (start, lines + 2, start, lines + 2),
+             " " + random_line(rand, words)]
+            + ["-" + x for x in old] + ["+" + x for x in new]
+            + [" " + random_line(rand, words)])
+
+def file_header(path):
+    return ["diff --git a/%s b/%s" % (path, path),
+            "index 0123456..789abcd 100644",
+            "--- a/%s" % path,
+            "+++ b/%s" % path]
+
+def huge_hunk(rand, scale):
+    """A single hunk replacing thousands of lines
+    """
+    return file_header("huge.py") + unified_hunk(rand, 2000 * scale, 1, 12)
+
+def tiny_hunks(rand, scale):
+    """Thousands of one line hunks
+    """
+    lines = file_header("tiny.py")
+    for i in range(5000 * scale):
+        lines += unified_hunk(rand, 1, i * 10 + 1, 6)
+    return lines
+
+def minified(rand, scale):
+    """A minified file made of a single long line
+    """
+    old = ";".join([random_line(rand, 8) for i in range(2000 * scale)])
+    new = ";".join([edit_line(rand, x) for x in old.split(";")])
+    return file_header("app.min.js") + ["@@ -1 +1 @@", "-" + old, "+" + new]
+
+def renames(rand, scale):
+    """Renames without any content change
+    """
+    lines = []
+    for i in range(20000 * scale):
+        lines += ["diff --git a/old/f%d.py b/new/f%d.py" % (i, i),
+                  "similarity index 100%",
+                  "rename from old/f%d.py" % i,
+                  "rename to new/f%d.py" % i]
+    return lines
+
+def git_log(rand, scale):
+    """A git log -p like stream of commits touching several files
+    """
+    lines = []
+    for c in range(200 * scale):
+        lines += ["commit %040x" % rand.getrandbits(160),
+                  "Author: A U Thor <author@example.com>",
+                  "Date:   Thu Apr 7 15:13:13 2005 -0700",
+                  "",
+                  "    " + random_line(rand, 8),
+                  ""]
+        for f in range(rand.randint(1, 5)):
+            lines += file_header("src/module%d.py" % rand.randrange(100))
+            for h in range(rand.randint(1, 4)):
+                lines += unified_hunk(rand, rand.randint(1, 8), h * 40 + 1, 10)
+    return lines
+
+CORPORA = {
+    "huge_hunk": huge_hunk,
+    "tiny_hunks": tiny_hunks,
+    "minified": minified,
+    "renames": renames,
+    "git_log": git_log,
+}
+
+def corpus_lines(name, scale):
+    if name in CORPORA:
+        return CORPORA[name](random.Random(name), scale)
+
+    f = open(name, "rb")
+    lines = [x.rstrip(b"\r\n") for x in f]
+    f.close()
+    return lines
+
+def peak_rss_kb(usage):
+    # Linux reports kilobytes, Mac OS X bytes
+    if sys.platform == "darwin":
+        return usage.ru_maxrss // 1024
+    return usage.ru_maxrss
+
+def count_hunks(lines):
+    d = diffc.Diffc()
+    return len([x for x in lines if d.is_info(x)])
+
+def bench_color(name, scale):
+    """Measures Diffc.color on the corpus in the current process
+    """
+    lines = corpus_lines(name, scale)
+
+    start = time.time()
+    output = diffc.Diffc().color_iter(lines)
+    first = None
+    for r in output:
+        if first is None:
+            first = time.time()
+    end = time.time()
+
+    return measurement(name, "color", lines, start, first, end,
+                       peak_rss_kb(resource.getrusage(resource.RUSAGE_SELF)))
+
+def bench_main(name, scale):
+    """Measures the diffc script reading the corpus from its stdin
+    """
+    lines = corpus_lines(name, scale)
+
+    f = tempfile.TemporaryFile()
+    f.write(b"\n".join(lines) + b"\n")
+    f.seek(0)
+
+    start = time.time()
+    proc = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, "diffc.py")],
+                            stdin=f, stdout=subprocess.PIPE)
+    first = None
+    while True:
+        block = os.read(proc.stdout.fileno(), 65536)
+        if not block:
+            break
+        if first is None:
+            first = time.time()
+    (pid, status, usage) = os.wait4(proc.pid, 0)
+    end = time.time()
+    f.close()
+
+    return measurement(name, "main", lines, start, first, end, peak_rss_kb(usage))
+
+def measurement(name, target, lines, start, first, end, peak_rss):
+    size = sum([len(x) + 1 for x in lines])
+    hunks = count_hunks(lines)
+    seconds = max(end - start, 1e-9)
+
+    if first is None:
+        first = end
+
+    return {
+        "corpus": name,
+        "target": target,
+        "bytes": size,
+        "lines": len(lines),
+        "hunks": hunks,
+        "seconds": round(seconds, 6),
+        "mb_per_s": round(size / seconds / 1000000, 6),
+        "hunks_per_s": round(hunks / seconds, 3),
+        "first_output_seconds": round(first - start, 6),
+        "peak_rss_kb": peak_rss,
+        "python": "%d.%d.%d" % sys.version_info[:3],
+    }
+
+CLEANUPS = ["diff_cleanupMerge", "diff_cleanupSemanticLossless",
+            "diff_cleanupSemantic", "diff_cleanupEfficiency"]
+
+def small_edits(rand, count):
+    """A diff of short equalities between unmerged small edits
+    """
+    diffs = []
+    for i in range(count):
+        diffs.append((0, rand.choice(WORDS)))
+        for j in range(rand.randint(1, 3)):
+            diffs.append((rand.choice([-1, 1]), " " + rand.choice(WORDS) + " "))
+    return diffs
+
+def bench_cleanup(name, scale):
+    """Measures a cleanup pass on diffs of 1, 2, 4 and 8 times as many edits
+    """
+    dmp = diffc.diff_match_patch()
+    results = []
+    for size in (1, 2, 4, 8):
+        count = 5000 * scale * size
+        diffs = small_edits(random.Random(count), count)
+        start = time.time()
+        getattr(dmp, name)(diffs)
+        seconds = max(time.time() - start, 1e-9)
+        results.append({
+            "cleanup": name,
+            "edits": count,
+            "seconds": round(seconds, 6),
+            "us_per_edit": round(seconds / count * 1000000, 3),
+            "python": "%d.%d.%d" % sys.version_info[:3],
+        })
+    return results
+
+def run_isolated(name, target, scale):
+    """Runs a measurement in a child process and returns its result
+    """
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                             "--run", target, "--scale", str(scale), name],
+                            stdout=subprocess.PIPE)
+    (out, err) = proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError("benchmark %s/%s failed" % (name, target))
+
+    return json.loads(out.decode("utf-8"))
+
+def main():
+    args = sys.argv[1:]
+
+    scale = 1
+    output = None
+    run = None
+    cleanup = False
+    names = []
+    while args:
+        arg = args.pop(0)
+        if arg == "--scale":
+            scale = int(args.pop(0))
+        elif arg == "--output":
+            output = args.pop(0)
+        elif arg == "--corpus":
+            names.append(args.pop(0))
+        elif arg == "--run":
+            run = args.pop(0)
+        elif arg == "--cleanup":
+            cleanup = True
+        else:
+            names.append(arg)
+
+    if run is not None:
+        # child process of run_isolated
+        bench = {"color": bench_color, "main": bench_main}[run]
+        sys.stdout.write(json.dumps(bench(names[0], scale)) + "\n")
+        return
+
+    if not names and not cleanup:
+        names = sorted(CORPORA)
+
+    out = sys.stdout
+    if output is not None:
+        out = open(output, "w")
+
+    if cleanup:
+        for name in CLEANUPS:
+            for result in bench_cleanup(name, scale):
+                out.write(json.dumps(result, sort_keys=True) + "\n")
+                out.flush()
+
+    for name in names:
+        for target in ("color", "main"):
+            out.write(json.dumps(run_isolated(name, target, scale), sort_keys=True) + "\n")
+            out.flush()
+
+    if output is not None:
+        out.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,17 @@
-#!/usr/bin/python2.4
+#!/usr/bin/python2.7
 
 import unittest
+import array
+import distutils.spawn
+import os
+import sys
+import json
+import pickle
+import random
+import shutil
+import subprocess
+import tempfile
+import time
 
 import diffc
 from diffc import Color
@@ -19,6 +30,24 @@ class TestDiffc(unittest.TestCase):
         CR = self.diffc.color_right_context
         CRD = self.diffc.color_right_diff
 
+    def tearDown(self):
+        if hasattr(self, 'tmpdir'):
+            shutil.rmtree(self.tmpdir)
+
+    def write_files(self, text1, text2):
+        self.tmpdir = tempfile.mkdtemp()
+        paths = []
+        for (name, text) in (('a', text1), ('b', text2)):
+            path = os.path.join(self.tmpdir, name)
+            if bytes is not str:
+                text = text.encode('latin-1')
+            f = open(path, 'wb')
+            f.write(text)
+            f.close()
+            paths.append(path)
+
+        return paths
+
     def test_trd_single_line(self):
         global CI, CD, CL, CLD, CR, CRD
 
@@ -261,5 +290,962 @@ class TestDiffc(unittest.TestCase):
         for i, v in enumerate(expected):
             self.assertEqual(v, result[i])
 
+    def test_stream_first_hunk(self):
+        global CI, CD, CL, CLD, CR, CRD
+
+        diff = ['1c1',
+                '< aaa',
+                '---',
+                '> axa',
+                '3c3',
+                '< ccc',
+                '---',
+                '> cxc']
+
+        consumed = []
+        def reader():
+            for line in diff:
+                consumed.append(line)
+                yield line
+
+        result = self.diffc.color_iter(reader())
+
+        expected = [
+            CI + '1c1' + CD,
+            CL + '< ' + CD + CL + 'a' + CD + CLD + 'a' + CD + CL + 'a' + CD,
+            '---',
+            CR + '> ' + CD + CR + 'a' + CD + CRD + 'x' + CD + CR + 'a' + CD,
+            CI + '3c3' + CD]
+
+        for i, v in enumerate(expected):
+            self.assertEqual(v, next(result))
+
+        # the first hunk is complete once the next range line has been read
+        self.assertEqual(5, len(consumed))
+
+    def test_sniff_without_range(self):
+        global CI, CD, CL, CLD, CR, CRD
+
+        diff = ['-aaa',
+                '+axa']
+
+        result = self.diffc.color(diff)
+
+        expected = [
+            CL + '-' + CD + CL + 'a' + CD + CLD + 'a' + CD + CL + 'a' + CD,
+            CR + '+' + CD + CR + 'a' + CD + CRD + 'x' + CD + CR + 'a' + CD]
+
+        self.assertEqual(len(expected), len(result))
+
+        for i, v in enumerate(expected):
+            self.assertEqual(v, result[i])
+
+    def test_detect_after_long_header(self):
+        global CI, CD, CL, CLD, CR, CRD
+
+        header = ['rename from a%d' % i for i in range(1000)]
+        diff = header + ['1c1',
+                         '< aaa',
+                         '---',
+                         '> axa']
+
+        result = self.diffc.color(diff)
+
+        expected = header + [
+            CI + '1c1' + CD,
+            CL + '< ' + CD + CL + 'a' + CD + CLD + 'a' + CD + CL + 'a' + CD,
+            '---',
+            CR + '> ' + CD + CR + 'a' + CD + CRD + 'x' + CD + CR + 'a' + CD]
+
+        self.assertEqual(len(expected), len(result))
+
+        for i, v in enumerate(expected):
+            self.assertEqual(v, result[i])
+
+    def test_word_granularity(self):
+        global CI, CD, CL, CLD, CR, CRD
+
+        diff = [
+            '@@ -1 +1 @@',
+            '-check this dokument. On',
+            '+check this document. On']
+
+        self.diffc.set_granularity('word')
+        result = self.diffc.color(diff)
+
+        expected = [
+            CI + '@@ -1 +1 @@' + CD,
+            CL + '-' + CD + CL + 'check this ' + CD \
+                + CLD + 'dokument' + CD + CL + '. On' + CD,
+            CR + '+' + CD + CR + 'check this ' + CD \
+                + CRD + 'document' + CD + CR + '. On' + CD]
+
+        self.assertEqual(expected, result)
+
+    def test_words_to_chars(self):
+        dmp = diffc.diff_match_patch()
+
+        (chars1, chars2, tokens) = dmp.diff_wordsToChars('a = b(c);', 'a = d(c);')
+
+        self.assertEqual(['', 'a', ' ', '=', 'b', '(', 'c', ');', 'd'], tokens)
+        self.assertEqual(u'\x01\x02\x03\x02\x04\x05\x06\x07', chars1)
+        self.assertEqual(u'\x01\x02\x03\x02\x08\x05\x06\x07', chars2)
+
+    def test_diff_trace(self):
+        dmp = diffc.diff_match_patch()
+        dmp.Diff_Algorithm = 'myers'
+        events = []
+        dmp.Diff_Trace = lambda event, info: events.append((event, info))
+
+        diffs = dmp.diff_main('abcxdef', 'abcydef')
+        dmp.diff_main('axbxc', 'ybycy')
+
+        self.assertEqual([(-1, 'x'), (1, 'y')], diffs[1:3])
+        names = [x[0] for x in events]
+        self.assertEqual('shortcut', names[0])
+        self.assertEqual('compute', names[1])
+        self.assertEqual(1, events[1][1]['depth'])
+        self.assertEqual(3, events[1][1]['prefix'])
+        self.assertTrue('bisect' in names)
+        info = [x[1] for x in events if x[0] == 'bisect'][0]
+        self.assertEqual(5, info['length1'])
+        self.assertFalse(info['timeout'])
+        self.assertTrue(info['iterations'] > 0)
+        self.assertEqual(0, dmp.Diff_TraceDepth)
+
+        del events[:]
+        dmp.diff_bisect('abc', 'xyz', 0)
+        self.assertEqual('bisect', events[0][0])
+        self.assertTrue(events[0][1]['timeout'])
+
+    def test_compute_step(self):
+        dmp = diffc.diff_match_patch()
+
+        step = dmp.diff_computeStep('1234567890', 'a345678z', False, sys.maxsize)
+        self.assertEqual(('12', 'a', [(0, '345678')], '90', 'z', False), step)
+        self.assertEqual([(-1, '12'), (1, 'a'), (0, '345678'), (-1, '90'), (1, 'z')],
+                         dmp.diff_compute('1234567890', 'a345678z', False, sys.maxsize))
+        self.assertEqual([(-1, 'a')], dmp.diff_computeStep('a', '', True, sys.maxsize))
+        # No half match without timeout, split at the middle snake
+        dmp.Diff_Timeout = 0
+        dmp.Diff_Algorithm = 'myers'
+        step = dmp.diff_computeStep('axbc', 'ybcy', True, sys.maxsize)
+        self.assertEqual(('ax', '', [], 'bc', 'ybcy', False), step)
+        # or diffed at once bit-parallel
+        dmp.Diff_Algorithm = 'auto'
+        step = dmp.diff_computeStep('axbc', 'ybcy', True, sys.maxsize)
+        self.assertEqual([(1, 'y'), (-1, 'ax'), (0, 'bc'), (1, 'y')], step)
+
+    def test_bisect_numpy(self):
+        # diff_match_patch may be bundled into diffc
+        if sys.modules[diffc.diff_match_patch.__module__].numpy is None:
+            self.skipTest('numpy is not available')
+
+        dmp = diffc.diff_match_patch()
+        texts = [('cat', 'map'), ('abcabba', 'cbabac'),
+                 ('the quick brown fox' * 20, 'the quack brown box' * 20),
+                 (u'x\u00e9y\u00e9z' * 30, u'y\u00e9x\u00e9z' * 30)]
+
+        dmp.Diff_NumPySteps = 0
+        expected = [dmp.diff_bisect(a, b, sys.maxsize) for (a, b) in texts]
+        # NumPy from the second step
+        dmp.Diff_NumPySteps = 1
+        events = []
+        dmp.Diff_Trace = lambda event, info: events.append((event, info))
+        result = [dmp.diff_bisect(a, b, sys.maxsize) for (a, b) in texts]
+
+        self.assertEqual(expected, result)
+        self.assertTrue([info for (event, info) in events
+                         if event == 'bisect' and info['vectorized']])
+
+    def test_bisect_cost(self):
+        dmp = diffc.diff_match_patch()
+        dmp.Diff_Timeout = 0
+        dmp.Diff_Algorithm = 'myers'
+        rand = random.Random(1)
+        text1 = ''.join([rand.choice('abcd') for i in range(400)])
+        text2 = ''.join([rand.choice('abcd') for i in range(400)])
+        events = []
+        dmp.Diff_BisectCost = 8
+        dmp.Diff_Trace = lambda event, info: events.append(info)
+
+        diffs = dmp.diff_main(text1, text2)
+
+        self.assertEqual(text1, dmp.diff_text1(diffs))
+        self.assertEqual(text2, dmp.diff_text2(diffs))
+        self.assertTrue([x for x in events if x.get('expensive')])
+        self.assertEqual(diffs, dmp.diff_main(text1, text2))
+        # the front path got furthest, to (3, 4) on diagonal -1
+        self.assertEqual((3, 4), dmp.diff_bisectFurthest(
+            5, 6, [-1, 0, 3, 2, -1, -1], [-1, -1, 0, -1, -1, -1], 3))
+
+    def test_onp(self):
+        dmp = diffc.diff_match_patch()
+        text1 = 'abcabba'
+        text2 = 'cbabac' + 'x' * 20
+        events = []
+        dmp.Diff_Trace = lambda event, info: events.append(event)
+
+        diffs = dmp.diff_onp(text1, text2, sys.maxsize)
+
+        self.assertEqual([(1, 'c'), (-1, 'a'), (0, 'b'), (-1, 'c'), (0, 'ab'),
+                          (-1, 'b'), (0, 'a'), (1, 'c' + 'x' * 20)], diffs)
+        self.assertEqual(['onp'], events)
+        # swapped texts, the same edits reversed
+        self.assertEqual([(-1, 'c'), (1, 'a'), (0, 'b'), (1, 'c'), (0, 'ab'),
+                          (1, 'b'), (0, 'a'), (-1, 'c' + 'x' * 20)],
+                         dmp.diff_onp(text2, text1, sys.maxsize))
+        self.assertEqual(None, dmp.diff_onp(text1, text2, 0))
+        # picked by diff_main for the asymmetric texts only
+        dmp.Diff_Timeout = 0
+        dmp.Diff_BitParallelChars = 0
+        del events[:]
+        dmp.diff_main(text1, text2)
+        self.assertTrue('onp' in events)
+        del events[:]
+        dmp.diff_main(text1, text2[:6])
+        self.assertFalse('onp' in events)
+        self.assertTrue('bisect' in events)
+
+    def test_bit_parallel(self):
+        dmp = diffc.diff_match_patch()
+        events = []
+        dmp.Diff_Trace = lambda event, info: events.append(event)
+
+        # a longest common subsequence of 4 characters
+        self.assertEqual([(1, 'c'), (-1, 'a'), (0, 'b'), (-1, 'c'), (0, 'a'),
+                          (-1, 'b'), (0, 'ba'), (1, 'c')],
+                         dmp.diff_bitParallel('abcabba', 'cbabac', sys.maxsize))
+        self.assertEqual([(1, 'xy')], dmp.diff_bitParallel('', 'xy', sys.maxsize))
+        self.assertEqual(['bitParallel', 'bitParallel'], events)
+        self.assertEqual(None, dmp.diff_bitParallel('abc', 'xyz', 0))
+        self.assertEqual('bitparallel', dmp.diff_algorithm('abc', 'xyz'))
+        # picked by the length of the longer text, not the product
+        self.assertEqual('onp', dmp.diff_algorithm('x' * 60, 'y' * 5000))
+        dmp.Diff_BitParallelChars = 2
+        self.assertEqual('myers', dmp.diff_algorithm('abc', 'xyz'))
+        self.assertEqual('onp', dmp.diff_algorithm('abc', 'uvwxyz' * 2))
+
+    def test_common_substring(self):
+        dmp = diffc.diff_match_patch()
+        moved = 'a moved block'
+        text1 = 'xxxxxxxxxxxxxxx' + moved + 'yyyyyyyyyyyyyyyyyy'
+        text2 = 'yyyyyyyy' + moved + 'zzzzzzzzzzzzzzzzzzzzzzzz'
+
+        self.assertEqual((15, 8, 13), dmp.diff_commonSubstring(text1, text2))
+        self.assertEqual((0, 0, 0), dmp.diff_commonSubstring('abc', 'xyz'))
+        # shorter than half the texts, split around only if long enough
+        self.assertEqual(None, dmp.diff_halfMatch(text1, text2))
+        dmp.Diff_HalfMatchChars = 10
+        self.assertEqual(('xxxxxxxxxxxxxxx', 'yyyyyyyyyyyyyyyyyy', 'yyyyyyyy',
+                          'zzzzzzzzzzzzzzzzzzzzzzzz', moved),
+                         dmp.diff_halfMatch(text1, text2))
+        dmp.Diff_HalfMatchChars = 14
+        self.assertEqual(None, dmp.diff_halfMatch(text1, text2))
+
+    def test_line_algorithms(self):
+        dmp = diffc.diff_match_patch()
+        text1 = 'f() {\n  x;\n}\n\ng() {\n  y;\n}\n'
+        text2 = 'f() {\n  x;\n}\n\nh() {\n  z;\n}\n\ng() {\n  y;\n}\n'
+
+        expected = [(0, 'f() {\n  x;\n}\n\n'), (1, 'h() {\n  z;\n}\n\n'),
+                    (0, 'g() {\n  y;\n}\n')]
+        for algorithm in ('patience', 'histogram'):
+            dmp.Diff_LineAlgorithm = algorithm
+            (chars1, chars2, line_array) = dmp.diff_linesToChars(text1, text2)
+            diffs = dmp.diff_lineChars(chars1, chars2)
+            dmp.diff_charsToLines(diffs, line_array)
+
+            self.assertEqual(expected, diffs)
+
+        self.assertEqual([(1, 'b'), (0, 'a'), (-1, 'b')], dmp.diff_patience('ab', 'ba'))
+        self.assertEqual([(-1, 'b'), (0, 'a'), (1, 'b')],
+                         dmp.diff_histogram('ba', 'ab'))
+
+    def test_line_mode_map(self):
+        dmp = diffc.diff_match_patch()
+        same = 'x = "a line long enough to be kept as an equality"\n'
+        text1 = same + 'b = 2\n' + same + 'd = 4\n' + same
+        text2 = same + 'b = 20\n' + same + 'd = 40\n' + same + 'f = 6\n'
+        expected = dmp.diff_lineMode(text1, text2, None)
+        blocks = []
+
+        def map_blocks(function, items):
+            blocks.extend([x[1:3] for x in items])
+            return map(function, items)
+        dmp.Diff_Map = map_blocks
+        diffs = dmp.diff_lineMode(text1, text2, None)
+
+        self.assertEqual(expected, diffs)
+        self.assertEqual([('b = 2\n', 'b = 20\n'), ('d = 4\n', 'd = 40\n')], blocks)
+        self.assertEqual(text2, dmp.diff_text2(diffs))
+
+    def test_line_mode_pool(self):
+        if diffc.multiprocessing is None:
+            self.skipTest('multiprocessing is not available')
+        dmp = diffc.diff_match_patch()
+        same = 'x = "a line long enough to be kept as an equality"\n'
+        text1 = same + 'b = 2\n' + same + 'd = 4\n' + same
+        text2 = same + 'b = 20\n' + same + 'd = 40\n' + same + 'f = 6\n'
+        expected = dmp.diff_lineMode(text1, text2, None)
+
+        pool = diffc.multiprocessing.Pool(2)
+        try:
+            dmp.Diff_Map = pool.map
+            dmp.Diff_Trace = lambda event, info: None
+            diffs = dmp.diff_lineMode(text1, text2, None)
+        finally:
+            pool.close()
+            pool.join()
+
+        self.assertEqual(expected, diffs)
+        # sent to the pool without the functions of this process
+        state = pickle.loads(pickle.dumps(dmp))
+        self.assertEqual(None, state.Diff_Map)
+        self.assertEqual(None, state.Diff_Trace)
+
+    def test_parallel(self):
+        dmp = diffc.diff_match_patch()
+        dmp.Diff_Timeout = 0
+        text1 = ''.join(['line %d\n' % i for i in range(30)])
+        text2 = text1.replace('line 5\n', 'line five\n').replace('line 25\n', '')
+        segments = []
+
+        def map_blocks(function, items):
+            segments.extend([x[1:3] for x in items])
+            return map(function, items)
+        dmp.Diff_Map = map_blocks
+        dmp.Diff_ParallelChars = 100
+        diffs = dmp.diff_main(text1, text2)
+
+        self.assertEqual(text1, dmp.diff_text1(diffs))
+        self.assertEqual(text2, dmp.diff_text2(diffs))
+        self.assertTrue(len(segments) > 2)
+        # the texts past their common prefix and suffix, cut before the same
+        # lines
+        prefix = dmp.diff_commonPrefix(text1, text2)
+        suffix = dmp.diff_commonSuffix(text1, text2)
+        self.assertEqual(text1[prefix:-suffix], ''.join([x[0] for x in segments]))
+        self.assertEqual(text2[prefix:-suffix], ''.join([x[1] for x in segments]))
+        for (segment1, segment2) in segments[1:]:
+            self.assertEqual(segment1.split('\n')[0], segment2.split('\n')[0])
+        # sent to other processes without the functions of this one
+        state = pickle.loads(pickle.dumps(dmp))
+        self.assertEqual(None, state.Diff_Map)
+        self.assertEqual(100, state.Diff_ParallelChars)
+
+    def test_parallel_ids(self):
+        dmp = diffc.diff_match_patch()
+        encoder = diffc.sequence_encoder()
+        text1 = ''.join(['line %d\n' % i for i in range(30)])
+        text2 = text1.replace('line 5\n', 'line five\n').replace('line 25\n', '')
+        ids1 = encoder.encode_lines(text1)
+        ids2 = encoder.encode_lines(text2)
+        lengths = [len(item) for item in encoder.items]
+        segments = []
+
+        def map_blocks(function, items):
+            segments.extend([x[1:3] for x in items])
+            return map(function, items)
+        dmp.Diff_Map = map_blocks
+        dmp.Diff_ParallelChars = 100
+        diffs = dmp.diff_parallelIds(ids1, ids2, lengths)
+
+        self.assertEqual(dmp.diff_toOpcodes(dmp.diff_lineIds(ids1, ids2)),
+                         dmp.diff_toOpcodes(diffs))
+        self.assertTrue(len(segments) > 2)
+        self.assertEqual(list(ids1), [x for (segment1, segment2) in segments for x in segment1])
+        self.assertEqual(list(ids2), [x for (segment1, segment2) in segments for x in segment2])
+        dmp.Diff_ParallelChars = 1000
+        self.assertEqual(None, dmp.diff_parallelIds(ids1, ids2, lengths))
+
+    def test_line_algorithm_option(self):
+        self.diffc.parse_args(['--line-algorithm', 'histogram'])
+        paths = self.write_files('1\n2\n3\n', '1\nx\n3\n')
+
+        result = list(self.diffc.color_items(self.diffc.compare(paths)))
+
+        self.assertEqual('histogram', self.diffc.word_diff_proc.Diff_LineAlgorithm)
+        self.assertEqual(CI + '2c2' + CD, result[0])
+        self.assertRaises(ValueError, self.diffc.set_line_algorithm, 'nope')
+
+    def test_sequence_encoder(self):
+        encoder = diffc.sequence_encoder()
+
+        ids1 = encoder.encode_lines('a\nb\na')
+        ids2 = encoder.encode_lines('b\nc\n')
+
+        self.assertEqual([1, 2, 3], list(ids1))
+        self.assertEqual([2, 4], list(ids2))
+        self.assertEqual('b\nc\n', encoder.decode(ids2))
+
+    def test_ids_to_chars(self):
+        dmp = diffc.diff_match_patch()
+        items = ['', 'a', 'b', 'c', 'd', 'e', 'f']
+        ids1 = array.array('l', [1, 2, 5, 3, 4])
+        ids2 = array.array('l', [1, 6, 3, 2, 4])
+
+        (chars1, chars2) = dmp.diff_idsToChars(ids1, ids2)
+        diffs = dmp.diff_main(chars1, chars2, False)
+        dmp.diff_charsToItems(diffs, ids1, ids2, items)
+
+        self.assertEqual(u'\x03\x05\x01\x06\x04', chars1)
+        self.assertEqual(u'\x03\x02\x06\x05\x04', chars2)
+        self.assertEqual('abecd', dmp.diff_text1(diffs))
+        self.assertEqual('afcbd', dmp.diff_text2(diffs))
+
+    def test_ids_above_code_points(self):
+        dmp = diffc.diff_match_patch()
+        dmp.Diff_Timeout = 0
+        n = sys.maxunicode + 100
+        ids1 = array.array('l', range(n))
+        ids2 = array.array('l', range(n))
+        ids2[0] = n
+        ids2[n // 2] = n + 1
+        ids2[-1] = n + 2
+
+        self.assertEqual(None, dmp.diff_idsToChars(ids1, ids2))
+        self.assertEqual([('replace', 0, 1, 0, 1), ('equal', 1, n // 2, 1, n // 2),
+                          ('replace', n // 2, n // 2 + 1, n // 2, n // 2 + 1),
+                          ('equal', n // 2 + 1, n - 1, n // 2 + 1, n - 1),
+                          ('replace', n - 1, n, n - 1, n)],
+                         dmp.diff_toOpcodes(dmp.diff_lineIds(ids1, ids2)))
+        self.assertEqual([(-1, [3]), (0, [1, 2]), (1, [3])],
+                         dmp.diff_ids([3, 1, 2], [1, 2, 3]))
+
+    def test_diff_sequences(self):
+        dmp = diffc.diff_match_patch()
+        records1 = [('GET', '/'), ('GET', '/a'), ('POST', '/b'), ('GET', '/c')]
+        records2 = [('GET', '/'), ('PUT', '/a'), ('POST', '/b'), ('GET', '/c'), ('GET', '/d')]
+
+        self.assertEqual([('equal', 0, 1, 0, 1), ('replace', 1, 2, 1, 2),
+                          ('equal', 2, 4, 2, 4), ('insert', 4, 4, 4, 5)],
+                         dmp.diff_sequences(records1, records2))
+        self.assertEqual([('delete', 0, 1, 0, 0), ('equal', 1, 3, 0, 2)],
+                         dmp.diff_sequences(array.array('l', [7, 8, 9]), [8, 9]))
+        self.assertEqual([], dmp.diff_sequences([], ()))
+
+        # more distinct items than code points
+        n = sys.maxunicode + 100
+        items = list(range(n))
+        self.assertEqual([('equal', 0, n // 2, 0, n // 2), ('delete', n // 2, n // 2 + 1, n // 2, n // 2),
+                          ('equal', n // 2 + 1, n, n // 2, n - 1), ('insert', n, n, n - 1, n)],
+                         dmp.diff_sequences(items, items[:n // 2] + items[n // 2 + 1:] + [n]))
+
+    def test_shared_line_encoder(self):
+        diff = [
+            '@@ -1,2 +1,2 @@',
+            '-aaa',
+            '-bbb',
+            '+aaa',
+            '+bxb',
+            '@@ -9,2 +9,2 @@',
+            '-aaa',
+            '-ccc',
+            '+aaa',
+            '+cxc']
+
+        self.diffc.set_max_word_diff_chars(10)
+        self.diffc.color(diff)
+
+        self.assertEqual(['', 'aaa\n', 'bbb\n', 'bxb\n', 'ccc\n', 'cxc\n'],
+                         self.diffc.word_diff_proc.Diff_LineEncoder.items)
+
+        # started over at the next file
+        self.diffc.color(['diff -u a/f b/f', diff[0], '-aaa', '-ddd', '+aaa', '+dxd'])
+
+        self.assertEqual(['', 'aaa\n', 'ddd\n', 'dxd\n'],
+                         self.diffc.word_diff_proc.Diff_LineEncoder.items)
+
+    def test_line_mode_encoder(self):
+        dmp = diffc.diff_match_patch()
+        dmp.Diff_LineEncoder = diffc.sequence_encoder()
+        text1 = 'alpha\nbeta\ngamma\n' * 50
+        text2 = 'alpha\nbeta\ndelta\n' * 50
+
+        diffs = dmp.diff_main(text1, text2, True)
+
+        self.assertEqual(text2, dmp.diff_text2(diffs))
+        self.assertTrue('alpha\n' in dmp.Diff_LineEncoder.items)
+        self.assertTrue('beta\n' in dmp.Diff_LineEncoder.items)
+        self.assertEqual(None, pickle.loads(pickle.dumps(dmp)).Diff_LineEncoder)
+
+    def test_line_diff_fallback(self):
+        global CI, CD, CL, CLD, CR, CRD
+
+        diff = [
+            '@@ -1,2 +1,2 @@',
+            '-aaa',
+            '-bbb',
+            '+aaa',
+            '+bxb']
+
+        self.diffc.set_max_word_diff_chars(10)
+        result = self.diffc.color(diff)
+
+        expected = [
+            CI + '@@ -1,2 +1,2 @@' + CD,
+            CL + '-' + CD + CL + 'aaa' + CD,
+            CL + '-' + CD + CL + CD + CLD + 'bbb' + CD,
+            CR + '+' + CD + CR + 'aaa' + CD,
+            CR + '+' + CD + CR + CD + CRD + 'bxb' + CD]
+
+        self.assertEqual(expected, result)
+
+    def test_line_diff_fallback_deleted_line(self):
+        global CI, CD, CL, CLD, CR, CRD
+
+        diff = ['@@ -1,2 +1 @@', '-a', '-b', '+a']
+
+        self.diffc.set_max_word_diff_chars(1)
+        result = self.diffc.color(diff)
+
+        expected = [
+            CI + '@@ -1,2 +1 @@' + CD,
+            CL + '-' + CD + CL + 'a' + CD + CLD + CD,
+            CL + '-' + CD + CLD + 'b' + CD,
+            CR + '+' + CD + CR + 'a' + CD]
+
+        self.assertEqual(expected, result)
+
+    def test_line_diff_fallback_added_line(self):
+        global CI, CD, CL, CLD, CR, CRD
+
+        diff = ['@@ -1 +1,2 @@', '-a', '+a', '+b']
+
+        self.diffc.set_max_word_diff_chars(1)
+        result = self.diffc.color(diff)
+
+        expected = [
+            CI + '@@ -1 +1,2 @@' + CD,
+            CL + '-' + CD + CL + 'a' + CD,
+            CR + '+' + CD + CR + 'a' + CD + CRD + CD,
+            CR + '+' + CD + CRD + 'b' + CD]
+
+        self.assertEqual(expected, result)
+
+    def test_hunk_timeout_line_fallback(self):
+        d = diffc.Diffc()
+        d.set_hunk_timeout(0.01)
+        deadlines = []
+        (diff_words, diff_lines) = (d.diff_words, d.diff_lines)
+
+        def slow_words(left_str, right_str, deadline):
+            deadlines.append(deadline)
+            time.sleep(0.02)
+            return diff_words(left_str, right_str, deadline)
+
+        def lines(left_str, right_str, deadline):
+            deadlines.append(deadline)
+            return diff_lines(left_str, right_str, deadline)
+        (d.diff_words, d.diff_lines) = (slow_words, lines)
+
+        (diffs, complete) = d.compute_word_diff(u'aaa', u'axa')
+
+        # highlighted line by line within the same budget
+        self.assertEqual([(-1, u'aaa'), (1, u'axa')], diffs)
+        self.assertFalse(complete)
+        self.assertEqual('line', d.strategy)
+        self.assertEqual(2, len(deadlines))
+        self.assertEqual(deadlines[0], deadlines[1])
+
+    def test_no_highlight_fallback(self):
+        global CI, CD, CL, CLD, CR, CRD
+
+        diff = ['1c1', '< aaa', '---', '> axa']
+        expected = [
+            CI + '1c1' + CD,
+            CL + '< ' + CD + CL + 'aaa' + CD,
+            '---',
+            CR + '> ' + CD + CR + 'axa' + CD]
+
+        self.diffc.set_max_line_diff_chars(5)
+        self.assertEqual(expected, self.diffc.color(diff))
+
+        # past the global deadline
+        d = diffc.Diffc()
+        d.set_timeout(0.001)
+        d.deadline -= 1
+        self.assertEqual(expected, d.color(diff))
+        self.assertEqual(0, len(d.cache.entries))
+
+    def test_multibyte_chars(self):
+        global CI, CD, CL, CLD, CR, CRD
+
+        diff = ['1c1', '< caf\xc3\xa9', '---', '> cafe']
+
+        result = self.diffc.color(diff)
+
+        expected = [
+            CI + '1c1' + CD,
+            CL + '< ' + CD + CL + 'caf' + CD + CLD + '\xc3\xa9' + CD,
+            '---',
+            CR + '> ' + CD + CR + 'caf' + CD + CRD + 'e' + CD]
+
+        self.assertEqual(expected, result)
+        for line in result:
+            self.assertTrue(isinstance(line, str))
+
+    def test_read_lines(self):
+        (r, w) = os.pipe()
+        os.write(w, b'aaa\r\n\nbbb\nccc')
+        os.close(w)
+
+        reads = []
+        result = list(diffc.read_lines(r, lambda: reads.append(1), 4))
+        os.close(r)
+
+        self.assertEqual([b'aaa', b'', b'bbb', b'ccc'], result)
+        self.assertEqual(5, len(reads))
+
+    def test_script_stdin(self):
+        global CI, CD, CL, CLD, CR, CRD
+
+        diff = b'1c1\n< caf\xc3\xa9 \xff\n---\n> cafe \xff\n'
+
+        proc = subprocess.Popen([sys.executable, diffc.__file__],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        result = proc.communicate(diff)[0]
+
+        expected = '\n'.join([
+            CI + '1c1' + CD,
+            CL + '< ' + CD + CL + 'caf' + CD + CLD + '\xc3\xa9' + CD + CL + ' \xff' + CD,
+            '---',
+            CR + '> ' + CD + CR + 'caf' + CD + CRD + 'e' + CD + CR + ' \xff' + CD,
+            ''])
+        if bytes is not str:
+            expected = expected.encode('latin-1')
+
+        self.assertEqual(0, proc.returncode)
+        self.assertEqual(expected, result)
+
+    def test_output_buffer(self):
+        class Out:
+            def __init__(self):
+                self.writes = []
+            def write(self, data):
+                self.writes.append(data)
+            def flush(self):
+                pass
+
+        out = Out()
+        buf = diffc.OutputBuffer(out, 8)
+        for line in [b'aaa', b'bbb', b'c']:
+            buf.write(line)
+        buf.flush()
+
+        self.assertEqual([b'aaa\nbbb\n', b'c\n'], out.writes)
+
+    def test_parallel_jobs(self):
+        diff = []
+        for i in range(50):
+            diff += ['@@ -%d,2 +%d,2 @@' % (i, i),
+                     '-check this dokument %d. On' % i,
+                     '-and that one %d' % (i * 7),
+                     '+check this document %d. On' % i,
+                     '+and this one %d' % (i * 3),
+                     ' context']
+
+        expected = diffc.Diffc().color(diff)
+
+        self.diffc.set_jobs(2)
+        self.diffc.PARALLEL_MIN_CHARS = 40
+        result = self.diffc.color(diff)
+
+        self.assertEqual(expected, result)
+
+    def test_parse_args(self):
+        args = self.diffc.parse_args(['-u', '--jobs', '3', 'a', '--jobs=2', 'b'])
+
+        self.assertEqual(['-u', 'a', 'b'], args)
+        self.assertEqual(2, self.diffc.jobs)
+        self.assertEqual(8, self.diffc.max_in_flight)
+
+    def test_trd_empty_line(self):
+        global CI, CD, CL, CLD, CR, CRD
+
+        diff = ['1c1', '< ', '---', '> aaa']
+
+        result = self.diffc.color(diff)
+
+        expected = [
+            CI + '1c1' + CD,
+            CL + '< ' + CD,
+            '---',
+            CR + '> ' + CD + CRD + 'aaa' + CD]
+
+        self.assertEqual(expected, result)
+
+    def test_cache(self):
+        diff = ['@@ -1 +1 @@', '-aaa', '+axa'] * 3
+
+        result = self.diffc.color(diff)
+
+        self.assertEqual(result[0:3], result[3:6])
+        self.assertEqual(result[0:3], result[6:9])
+        self.assertEqual(2, self.diffc.cache.hits)
+        self.assertEqual(1, self.diffc.cache.misses)
+
+    def test_cache_eviction(self):
+        cache = diffc.WordDiffCache(2, 1024)
+
+        for s in ['a', 'b', 'a', 'c']:
+            cache.put(cache.key(s, s, ()), [(0, s)])
+
+        self.assertEqual(2, len(cache.entries))
+        self.assertEqual(None, cache.get(cache.key('b', 'b', ())))
+        self.assertEqual([(0, 'a')], cache.get(cache.key('a', 'a', ())))
+
+        cache.put(cache.key('d', 'd', ()), [(0, 'd' * 900)])
+        self.assertEqual(1, len(cache.entries))
+        self.assertTrue(cache.size <= 1024)
+
+    def test_cache_file(self):
+        global CI, CD, CL, CLD, CR, CRD
+
+        if diffc.sqlite3 is None:
+            return
+
+        self.tmpdir = tempfile.mkdtemp()
+        path = os.path.join(self.tmpdir, 'cache.db')
+        diff = ['@@ -1 +1 @@', '-check this dokument. On', '+check this document. On']
+
+        self.diffc.set_cache_file(path)
+        expected = self.diffc.color(diff)
+        self.diffc.close()
+
+        d = diffc.Diffc()
+        d.set_cache_entries(0)
+        d.set_cache_file(path)
+        d.word_diff_proc.diff_main = None
+        result = d.color(diff)
+        d.close()
+
+        self.assertEqual(expected, result)
+
+    def test_cache_file_eviction(self):
+        if diffc.sqlite3 is None:
+            return
+
+        self.tmpdir = tempfile.mkdtemp()
+        path = os.path.join(self.tmpdir, 'cache.db')
+
+        randrange = diffc.random.randrange
+        diffc.random.randrange = lambda n: 1
+        try:
+            cache = diffc.FileWordDiffCache(path, 500, 1)
+            cache.open().execute("INSERT INTO word_diff VALUES (?, ?, ?, ?)",
+                                 (diffc.sqlite3.Binary(b'old'), '=1', 5, 0))
+            cache.put(b'new', [(0, 'a')])
+            cache.close()
+
+            # a small write leaves the limits unchecked
+            db = diffc.sqlite3.connect(path)
+            self.assertEqual(2, db.execute("SELECT COUNT(*) FROM word_diff").fetchone()[0])
+            db.close()
+
+            cache = diffc.FileWordDiffCache(path, 500, 1)
+            for i in range(100):
+                cache.put(b'key%d' % i, [(0, 'a' * 10)])
+            cache.close()
+        finally:
+            diffc.random.randrange = randrange
+
+        db = diffc.sqlite3.connect(path)
+        (count, size, old) = db.execute(
+            "SELECT COUNT(*), TOTAL(size), TOTAL(atime = 0) FROM word_diff").fetchone()
+        plan = db.execute("EXPLAIN QUERY PLAN SELECT key FROM word_diff "
+                          "ORDER BY atime LIMIT 1").fetchall()
+        db.close()
+
+        self.assertTrue(0 < count < 100)
+        self.assertTrue(size <= 500)
+        self.assertEqual(0, old)
+        self.assertTrue('word_diff_atime' in str(plan))
+
+    def test_cache_file_encoding(self):
+        cache = diffc.FileWordDiffCache(None, 0, 0)
+        diffs = [(0, 'ab'), (-1, 'c'), (1, 'de'), (0, 'f')]
+
+        encoded = cache.encode(diffs)
+
+        self.assertEqual('=2-1+2=1', encoded)
+        self.assertEqual(diffs, cache.decode(encoded, 'abcf', 'abdef'))
+        self.assertEqual(None, cache.decode(encoded, 'abcfg', 'abdef'))
+
+    def test_compare_trd(self):
+        global CI, CD, CL, CLD, CR, CRD
+
+        paths = self.write_files('aaa\nbbb\nccc\n', 'aaa\nbxb\nccc\nddd')
+
+        result = list(self.diffc.color_items(self.diffc.compare(paths)))
+
+        expected = [
+            CI + '2c2' + CD,
+            CL + '< ' + CD + CL + 'b' + CD + CLD + 'b' + CD + CL + 'b' + CD,
+            '---',
+            CR + '> ' + CD + CR + 'b' + CD + CRD + 'x' + CD + CR + 'b' + CD,
+            CI + '3a4' + CD,
+            CR + '> ' + CD + CRD + 'ddd' + CD,
+            '\\ No newline at end of file']
+
+        self.assertEqual(expected, result)
+
+    def test_compare_crlf(self):
+        global CI, CD, CL, CLD, CR, CRD
+
+        paths = self.write_files('a\r\nbbb\r\n', 'a\r\nbxb\r\n')
+
+        result = list(self.diffc.color_items(self.diffc.compare(paths)))
+
+        expected = [
+            CI + '2c2' + CD,
+            CL + '< ' + CD + CL + 'b' + CD + CLD + 'b' + CD + CL + 'b\r' + CD,
+            '---',
+            CR + '> ' + CD + CR + 'b' + CD + CRD + 'x' + CD + CR + 'b\r' + CD]
+
+        self.assertEqual(expected, result)
+
+    def test_compare_no_eol_hunk(self):
+        global CI, CD, CL, CLD, CR, CRD
+
+        paths = self.write_files('aaa\nbbb', 'aaa\nbxb\n')
+
+        result = list(self.diffc.color_items(
+            self.diffc.compare(['-U', '0'] + paths)))
+
+        expected = [
+            CI + '@@ -2 +2 @@' + CD,
+            CL + '-' + CD + CL + 'b' + CD + CLD + 'b' + CD + CL + 'b' + CD,
+            '\\ No newline at end of file',
+            CR + '+' + CD + CR + 'b' + CD + CRD + 'x' + CD + CR + 'b' + CD]
+
+        self.assertEqual(expected, result[2:])
+
+    def test_no_eol_hunk(self):
+        global CI, CD, CL, CLD, CR, CRD
+
+        diff = ['1c1', '< aaa', '\\ No newline at end of file', '---', '> axa']
+
+        result = self.diffc.color(diff)
+
+        expected = [
+            CI + '1c1' + CD,
+            CL + '< ' + CD + CL + 'a' + CD + CLD + 'a' + CD + CL + 'a' + CD,
+            '\\ No newline at end of file',
+            '---',
+            CR + '> ' + CD + CR + 'a' + CD + CRD + 'x' + CD + CR + 'a' + CD]
+
+        self.assertEqual(expected, result)
+
+    def test_compare_jobs(self):
+        if diffc.multiprocessing is None:
+            self.skipTest('multiprocessing is not available')
+        lines = ['line %d of the file\n' % i for i in range(200)]
+        text1 = ''.join(lines)
+        lines[20] = 'line twenty of the file\n'
+        lines[100:140] = ['changed %s' % x for x in lines[100:140]]
+        del lines[180]
+        text2 = ''.join(lines)
+        paths = self.write_files(text1, text2)
+
+        for args in (paths, ['-u'] + paths):
+            d = diffc.Diffc()
+            d.max_word_diff_chars = 10000
+            expected = list(d.color_items(d.compare(args)))
+
+            self.diffc.set_jobs(2)
+            self.diffc.max_word_diff_chars = 10000
+            # the files and the hunk of 40 lines split over the pool
+            self.diffc.line_diff_proc.Diff_ParallelChars = 500
+            self.diffc.word_diff_proc.Diff_ParallelChars = 500
+            result = list(self.diffc.color_items(self.diffc.compare(args)))
+
+            self.assertEqual(expected, result)
+            self.assertEqual(None, self.diffc.line_diff_proc.Diff_Map)
+            self.assertEqual(None, self.diffc.word_diff_proc.Diff_Map)
+
+    def test_compare_uni(self):
+        global CI, CD, CL, CLD, CR, CRD
+
+        paths = self.write_files('1\n2\n3\n4\n5\n6\n7\n8\n9\n',
+                                 '1\n2\n3\n4\n5\n6\n7\nx\n9\n')
+
+        result = list(self.diffc.color_items(
+            self.diffc.compare(['-U', '1'] + paths)))
+
+        expected = [
+            CI + '@@ -7,3 +7,3 @@' + CD,
+            ' 7',
+            CL + '-' + CD + CLD + '8' + CD,
+            CR + '+' + CD + CRD + 'x' + CD,
+            ' 9']
+
+        self.assertEqual(expected, result[2:])
+
+    def test_compare_like_diff(self):
+        if not distutils.spawn.find_executable('diff'):
+            self.skipTest('diff is not available')
+        lines1 = ['line %d\n' % i for i in range(20000)]
+        lines2 = list(lines1)
+        for i in range(len(lines1) - 10, 0, -67):
+            if i % 3 == 0:
+                lines2[i] = 'changed %d\n' % i
+            elif i % 3 == 1:
+                del lines2[i]
+            else:
+                lines2.insert(i, 'added %d\n' % i)
+        paths = self.write_files(''.join(lines1), ''.join(lines2))
+        # the whole file is diffed, whatever the hunk budget
+        self.diffc.parse_args(['--hunk-timeout', '0.001'])
+
+        result = [x for x in self.diffc.compare(paths) if type(x) is not tuple]
+
+        proc = subprocess.Popen(['diff'] + paths, stdout=subprocess.PIPE,
+                                universal_newlines=True)
+        expected = [x for x in proc.communicate()[0].splitlines()
+                    if x[:1].isdigit()]
+        self.assertEqual(len(range(len(lines1) - 10, 0, -67)), len(expected))
+        self.assertEqual([CI + x + CD for x in expected], result)
+
+    def test_compare_uni_header(self):
+        if not distutils.spawn.find_executable('diff'):
+            self.skipTest('diff is not available')
+        paths = self.write_files('a\n', 'b\n')
+        for path in paths:
+            os.utime(path, (1000000000.123456, 1000000000.123456))
+
+        result = list(self.diffc.compare(['-u'] + paths))
+
+        proc = subprocess.Popen(['diff', '-u'] + paths, stdout=subprocess.PIPE,
+                                universal_newlines=True)
+        expected = proc.communicate()[0].splitlines()[:2]
+        self.assertEqual(expected, result[0][0] + result[0][2])
+
+    def test_compare_fallback(self):
+        paths = self.write_files('a\0', 'b\0')
+
+        self.assertEqual(None, self.diffc.compare(paths))
+        self.assertEqual(None, self.diffc.compare(['-r'] + paths))
+
+    def test_stats(self):
+        self.tmpdir = tempfile.mkdtemp()
+        path = os.path.join(self.tmpdir, 'stats.json')
+        self.diffc.set_stats(path)
+
+        lines = ['@@ -1 +1 @@', '-abc', '+abd', '@@ -5 +5 @@', '-abc', '+abd']
+        list(self.diffc.color_iter(lines))
+        self.diffc.close()
+
+        stats = json.load(open(path))
+
+        self.assertEqual(2, stats['hunks'])
+        self.assertEqual({'char': 1, 'cache': 1}, stats['strategies'])
+        self.assertEqual(2, len(stats['slowest_hunks']))
+        self.assertEqual(1, stats['cache']['hits'])
+        self.assertTrue('word_diff' in stats['phases'])
+        self.assertTrue('render' in stats['phases'])
+        self.assertTrue(stats['paths']['shortcut'] > 0)
+
 if __name__ == "__main__":
     unittest.main()